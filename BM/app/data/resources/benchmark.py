@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from tqdm import tqdm
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+data_dir = os.path.dirname(script_dir)
+app_dir = os.path.dirname(data_dir)
+sys.path.append(app_dir)
+sys.path.append(script_dir)
+
+from main import HTTPSession, MapsScraper, Metrics, RateLimiter, ResultWriter, Scheduler, Utils
+from mock_api import MockMicropoi
+
+
+def run_once(mock, category_ids, tile_sets, workers, rate_limit=None, trace_memory=True):
+    """Scrapes the mock API once, headless and without the response cache or density map, into a
+    temporary folder. Returns a dict of requests, tiles, wall time, throughput, peak Python memory
+    and completeness, the share of the mock's points within the tile sets that were found, along
+    with the retries and mean latency recorded by the run's Metrics."""
+
+    temp_dir = tempfile.mkdtemp(prefix="bm-benchmark-")
+    requests_before = mock.stats()["requests"]
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+
+    session = HTTPSession(pool_size=max(workers, 10))
+    writer = ResultWriter(filepath=os.path.join(temp_dir, "scraped.csv"))
+    rate_limiter = RateLimiter(**(rate_limit or {"rate": 10000, "burst": 1000}))
+    metrics = Metrics()
+    prog_bar = tqdm(disable=True)
+    initial_tiles = MapsScraper.load_tiles(tile_sets)
+    # Collaborators are shared by the categories as in App.run_scraper, the rest are MapsScraper defaults
+    scrapers = []
+    for category_id_i, category_id in enumerate(category_ids):
+        scrapers.append(MapsScraper(
+            params = {
+                "url": mock.url,
+                "category_id_i": category_id_i,
+                "category_id": category_id,
+                "tile_sets": tile_sets,
+                "workers": workers,
+                "rate_limiter": rate_limiter,
+                "session": session,
+                "checkpoint": os.path.join(temp_dir, "checkpoints", f"{category_id}.jsonl"),
+                "writer": writer,
+                "metrics": metrics,
+                "initial_tiles": initial_tiles,
+                "prog_bar": prog_bar,
+            }
+        ))
+    scheduler = Scheduler(scrapers, workers=workers, visualiser_settings={"display": False})
+    scheduler.run()
+    writer.close()
+    session.close()
+
+    wall_time = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    # Compare the ids found with the mock's points within the initial tiles
+    found = set(pd.read_csv(writer.filepath, usecols=["id"], dtype=str)["id"]) if writer.count else set()
+    expected = set()
+    for category_id in category_ids:
+        expected |= mock.expected_ids(category_id, {tile.tile_id for tile in initial_tiles})
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    n_requests = mock.stats()["requests"] - requests_before
+    summary = metrics.summary()
+    return {
+        "requests": n_requests,
+        "tiles": scheduler.completed,
+        "wall_s": round(wall_time, 2),
+        "tiles_per_s": round(scheduler.completed / wall_time, 1),
+        "requests_per_s": round(n_requests / wall_time, 1),
+        "retries": summary["retries"],
+        "latency_mean_s": summary["latency_mean_s"],
+        "peak_mb": round(peak / 1024 / 1024, 1) if peak is not None else None,
+        "results": len(found),
+        "expected": len(expected),
+        "completeness": round(len(found & expected) / len(expected), 4) if expected else 1.0,
+    }
+
+
+def startup_time(repeats=3):
+    """Measures the time to import main in a fresh interpreter, the startup cost of every run.
+    Returns the fastest of repeats imports in seconds and the heavy modules loaded by the import,
+    which should be none as plotting, pandas and geocoding are imported lazily."""
+    code = ("import sys, time, json; start = time.perf_counter(); import main; "
+            "print(json.dumps([time.perf_counter() - start, "
+            "[name for name in ('matplotlib', 'seaborn', 'pandas', 'PIL', 'sidt.utils.geocoders', 'sidt.utils.git') if name in sys.modules]]))")
+    times, heavy = [], []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd=app_dir, capture_output=True, text=True, check=True).stdout
+        import_time, heavy = json.loads(output.strip().splitlines()[-1])
+        times.append(import_time)
+    return min(times), heavy
+
+
+def benchmark(tile_sets=(["uk"],), workers=(1, 4, 16), category_ids=("90089",), repeats=1, mock_settings=None,
+              rate_limit=None, trace_memory=True, save=True):
+    """Runs the scraper end to end against a local MockMicropoi for every combination of tile sets
+    and worker count, repeats times each. mock_settings are passed to MockMicropoi, e.g.
+    {"latency": 0.1, "throttle_rate": 0.02}. The startup time of main is measured first and
+    included in every row. Prints the results and saves them to output/benchmarks/<timestamp>.csv.
+    Returns the results as a DataFrame."""
+
+    import_s, heavy = startup_time()
+    print(f"Importing main takes {import_s:.3f}s" + (f", loading {', '.join(heavy)}" if heavy else ""))
+
+    rows = []
+    with MockMicropoi(**(mock_settings or {})) as mock:
+        for tile_set_names in tile_sets:
+            for n_workers in workers:
+                for repeat in range(repeats):
+                    print(f"Benchmarking {'+'.join(tile_set_names)} with {n_workers} workers ({repeat + 1}/{repeats})")
+                    rows.append({
+                        "tile_sets": "+".join(tile_set_names),
+                        "workers": n_workers,
+                        "categories": len(category_ids),
+                        "repeat": repeat,
+                        "import_s": round(import_s, 3),
+                        **run_once(mock, list(category_ids), list(tile_set_names), n_workers, rate_limit, trace_memory),
+                    })
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False))
+    if save:
+        os.makedirs(os.path.join(app_dir, "output", "benchmarks"), exist_ok=True)
+        Utils.save_data_to_csv(
+            filepath = os.path.join(app_dir, "output", "benchmarks", f"{time.strftime('%Y-%m-%d-%H%M%S')}.csv"),
+            data = rows
+            )
+    return df
+
+
+if __name__ == "__main__":
+    benchmark(
+        tile_sets = [["uk"]],
+        workers = [1, 4, 16],
+        category_ids = ["90089", "30049"],
+        mock_settings = {"latency": 0.05, "jitter": 0.02},
+    )
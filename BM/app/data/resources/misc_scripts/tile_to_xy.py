@@ -1,26 +1,16 @@
+import os
+import sys
+
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
 from matplotlib.patches import Rectangle
 
+script_dir = os.path.dirname(os.path.realpath(__file__))
+app_dir = os.path.dirname(os.path.dirname(os.path.dirname(script_dir)))
+sys.path.append(app_dir)
 
-def tile_to_xy(tile):
-    tile_id = tile#["tile_id"]
-
-    x1, y1 = 0, 0
-    x2, y2 = 1, 1
-    for digit in tile_id:
-        x_mid = (x2 + x1)/2
-        y_mid = (y2 + y1)/2
-        if digit in ["0", "1"]:
-            y1 = y_mid
-        if digit in ["2", "3"]:
-            y2 = y_mid
-        if digit in ["0", "2"]:
-            x2 = x_mid
-        if digit in ["1", "3"]:
-            x1 = x_mid
-    coords.append({"x1": x1, "x2": x2, "y1": y1, "y2": y2})
+from main import Quadkey
 
 
 tiles = [
@@ -31,9 +21,8 @@ tiles = [
                 "0320"
 ]
 
-coords = []
-for tile in tiles:
-    tile_to_xy(tile)
+x1, y1, x2, y2 = Quadkey.to_bounds(tiles, crs="normalised")
+coords = pd.DataFrame({"x1": x1, "x2": x2, "y1": y1, "y2": y2}).to_dict("records")
 
 print(coords)
 
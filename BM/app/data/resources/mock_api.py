@@ -0,0 +1,217 @@
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+import numpy as np
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+data_dir = os.path.dirname(script_dir)
+app_dir = os.path.dirname(data_dir)
+sys.path.append(app_dir)
+
+from main import MapsScraper, Quadkey
+
+
+# Default spatial density, a few city clusters over a uniform background covering the uk tile set
+default_density = {
+    "clusters": [
+        # latitude, longitude, standard deviation in degrees, number of points
+        (51.51, -0.13, 0.25, 6000),
+        (53.48, -2.24, 0.15, 2500),
+        (52.48, -1.90, 0.15, 2000),
+        (55.86, -4.25, 0.12, 1500),
+        (53.35, -6.26, 0.10, 1000),
+    ],
+    "background": {"bounds": (49.9, -10.5, 58.7, 1.8), "n": 5000},
+}
+
+
+class MockMicropoi():
+    """Local stand-in for the /api/v7/micropoi endpoint, serving synthetic POIs drawn from a
+    configurable spatial density. Each category gets its own seeded set of points, a request
+    returns the points whose quadkey starts with the tileId, up to the result cap. Latency,
+    server errors, throttling (429 with Retry-After) and the API's spurious empty responses
+    can be injected at given rates. Runs in its own process so the scraper is measured alone."""
+
+    level = 21
+
+    def __init__(self, density=None, seed=0, latency=0.05, jitter=0.02, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, empty_rate=0.0, port=8765):
+        """density is a dict of "clusters", a list of (latitude, longitude, std in degrees, n), and
+        a uniform "background" of n points within bounds (lat1, lon1, lat2, lon2). latency and
+        jitter are in seconds, the rates are the fraction of requests answered with HTTP 500,
+        HTTP 429 or an empty response."""
+        self.density = density or default_density
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.empty_rate = empty_rate
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}/api/v7/micropoi"
+        self.points = {}
+        self.process = None
+
+
+    def category_points(self, category_id):
+        """Returns the points of a category as (sorted quadkeys, ids, latitudes, longitudes) arrays"""
+        if category_id in self.points:
+            return self.points[category_id]
+
+        rng = np.random.default_rng([self.seed, zlib.crc32(str(category_id).encode())])
+        lats, lons = [], []
+        for lat, lon, std, n in self.density["clusters"]:
+            lats.append(rng.normal(lat, std, n))
+            lons.append(rng.normal(lon, std * 1.6, n))
+        lat1, lon1, lat2, lon2 = self.density["background"]["bounds"]
+        lats.append(rng.uniform(lat1, lat2, self.density["background"]["n"]))
+        lons.append(rng.uniform(lon1, lon2, self.density["background"]["n"]))
+        lats, lons = np.concatenate(lats), np.concatenate(lons)
+
+        quadkeys = Quadkey.from_points(lats, lons, MockMicropoi.level)
+        order = np.argsort(quadkeys, kind="stable")
+        ids = np.array([f"MOCK{category_id}x{i}" for i in range(len(lats))])
+        self.points[category_id] = (quadkeys[order], ids[order], lats[order].round(6), lons[order].round(6))
+        return self.points[category_id]
+
+
+    def search(self, category_id, tile_id):
+        """Returns the number of points within a tile and the first result_cap of them as results"""
+        quadkeys, ids, lats, lons = self.category_points(category_id)
+        start = np.searchsorted(quadkeys, tile_id, side="left")
+        end = np.searchsorted(quadkeys, tile_id + "4", side="left")
+        results = [{
+            "id": ids[i],
+            "name": f"Mock location {ids[i]}",
+            "geo": {"latitude": float(lats[i]), "longitude": float(lons[i])},
+            } for i in range(start, min(end, start + MapsScraper.result_cap))]
+        return end - start, results
+
+
+    def expected_ids(self, category_id, tile_ids):
+        """Returns the set of ids of a category's points within any of the given tiles, used
+        to measure how complete a scrape was"""
+        quadkeys, ids, _, _ = self.category_points(category_id)
+        expected = set()
+        for tile_id in tile_ids:
+            start = np.searchsorted(quadkeys, tile_id, side="left")
+            end = np.searchsorted(quadkeys, tile_id + "4", side="left")
+            expected.update(ids[start:end].tolist())
+        return expected
+
+
+    def serve(self):
+        """Serves requests until the process is terminated"""
+        mock = self
+        rng = random.Random(self.seed)
+        lock = threading.Lock()
+        stats = {"requests": 0, "status_codes": {}, "bytes": 0, "capped": 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes, without TCP_NODELAY Nagle's algorithm and delayed
+            # ACKs hold the body back by about 40 ms on keep-alive connections
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/stats":
+                    with lock:
+                        snapshot = json.loads(json.dumps(stats))
+                    return self.respond(200, snapshot, count=False)
+                if url.path != "/api/v7/micropoi":
+                    return self.respond(404, {"error": "Not found"})
+
+                params = {key: val[0] for key, val in parse_qs(url.query, keep_blank_values=True).items()}
+                with lock:
+                    draw = rng.random()
+                    delay = max(0, mock.latency + rng.uniform(-mock.jitter, mock.jitter))
+                time.sleep(delay)
+
+                if draw < mock.throttle_rate:
+                    return self.respond(429, {"error": "Too many requests"}, {"Retry-After": str(mock.retry_after)})
+                draw -= mock.throttle_rate
+                if draw < mock.error_rate:
+                    return self.respond(500, {"error": "Internal server error"})
+                draw -= mock.error_rate
+                if draw < mock.empty_rate:
+                    return self.respond(200, {"_type": "MicroPoi"})
+
+                n_points, results = mock.search(params.get("categoryid", ""), params.get("tileId", ""))
+                if n_points > MapsScraper.result_cap:
+                    with lock:
+                        stats["capped"] += 1
+                return self.respond(200, {"_type": "MicroPoi", "results": [results]} if results else {"_type": "MicroPoi"})
+
+            def respond(self, status_code, body, headers=None, count=True):
+                data = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, val in (headers or {}).items():
+                    self.send_header(key, val)
+                self.end_headers()
+                self.wfile.write(data)
+                if count:
+                    with lock:
+                        stats["requests"] += 1
+                        stats["status_codes"][str(status_code)] = stats["status_codes"].get(str(status_code), 0) + 1
+                        stats["bytes"] += len(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        with ThreadingHTTPServer(("127.0.0.1", self.port), Handler) as server:
+            server.serve_forever()
+
+
+    def start(self):
+        """Starts serving in a separate process and waits until the server accepts requests"""
+        process = multiprocessing.Process(target=self.serve, daemon=True)
+        process.start()
+        self.process = process
+        for _ in range(100):
+            try:
+                self.stats()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"Mock micropoi server did not start on port {self.port}")
+
+
+    def stats(self):
+        """Returns the server's request counters, by status code, and the bytes served"""
+        with urlopen(f"http://127.0.0.1:{self.port}/stats", timeout=5) as response:
+            return json.loads(response.read())
+
+
+    def stop(self):
+        """Stops the server process"""
+        if self.process:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    mock = MockMicropoi()
+    print(f"Serving mock micropoi API at {mock.url}")
+    mock.serve()
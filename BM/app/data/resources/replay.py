@@ -0,0 +1,63 @@
+import sys
+import os
+
+import matplotlib
+from matplotlib.animation import FFMpegWriter, PillowWriter
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+data_dir = os.path.dirname(script_dir)
+app_dir = os.path.dirname(data_dir)
+sys.path.append(app_dir)
+
+from main import EventLog, TilePlot
+
+
+def replay(event_log, output, speed=60, fps=10, visualiser_settings=None, dpi=100):
+    """Replays the event log of a scrape through TilePlot and saves the progress as a GIF, or as
+    an MP4 if output ends in .mp4 (requires ffmpeg). speed is the seconds of scraping shown per
+    second of video. Paths are relative to the output folder, e.g. "2024-11/uk/events.jsonl"."""
+
+    events = EventLog.read(os.path.join(app_dir, "output", event_log))
+    _, initial_tile_ids, category_ids = next(events)
+
+    # Frames are rendered in full, so the plot is not blitted
+    matplotlib.use("Agg")
+    settings = {"overlay_map": False, "overlay_ids": False, **(visualiser_settings or {}), "blit": False}
+    plot = TilePlot([{"tile_id": tile_id} for tile_id in initial_tile_ids], settings=settings)
+    writer = FFMpegWriter(fps=fps) if output.endswith(".mp4") else PillowWriter(fps=fps)
+
+    # Every category searches the tiles separately, so pending tiles are counted per category
+    pending = {(category_i, tile_id) for category_i in range(len(category_ids)) for tile_id in initial_tile_ids}
+    completed, found = 0, 0
+    frame_end = speed / fps
+    with writer.saving(plot.fig, os.path.join(app_dir, "output", output), dpi):
+        for event in events:
+            if event[0] != "f":
+                continue
+            _, t, category_i, tile_id, n_results, n_stored, new_tiles = event
+
+            # Show the state at the end of each frame before this event
+            while t > frame_end:
+                writer.grab_frame()
+                frame_end += speed / fps
+
+            # Replay the finished tile
+            new_tile_ids = [tile_id + suffix for suffix in new_tiles]
+            pending.discard((category_i, tile_id))
+            pending.update((category_i, new_tile_id) for new_tile_id in new_tile_ids)
+            completed += 1
+            found += n_stored
+            plot.update({"tile_id": tile_id}, [{"tile_id": new_tile_id} for new_tile_id in new_tile_ids], draw=False)
+            plot.update_labels({
+                "Category ID": f"{category_i}: {category_ids[category_i]}",
+                "Tiles Completed": completed,
+                "Tiles Remaining": len(pending),
+                "Locations Found": found,
+                "Elapsed": f"{round(t)}s",
+                "Current Search Tile": tile_id,
+                }, draw=False)
+        writer.grab_frame()
+
+
+if __name__ == "__main__":
+    replay("2024-11/testing-ui-changes/events.jsonl", "2024-11/testing-ui-changes/progress.gif")
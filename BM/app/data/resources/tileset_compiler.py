@@ -0,0 +1,125 @@
+import json
+import sys
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.ops import unary_union
+
+# The array API (shapely.box, shapely.prepare, vectorised predicates) was added in shapely 2.0,
+# geopandas 0.14 still accepts shapely 1.8
+if int(shapely.__version__.split(".")[0]) < 2:
+    raise ImportError(f"tileset_compiler requires shapely>=2.0, found {shapely.__version__}")
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+data_dir = os.path.dirname(script_dir)
+app_dir = os.path.dirname(data_dir)
+sys.path.append(app_dir)
+
+from main import MapsScraper, Quadkey
+
+
+# Equal area projection used to measure covered and wasted area
+area_crs = "EPSG:6933"
+
+
+def quadkey_boxes(quadkeys):
+    """Converts a list of quadkeys into an array of their WGS84 bounding boxes"""
+    if not len(quadkeys):
+        return np.array([], dtype=object)
+    return shapely.box(*Quadkey.to_bounds(quadkeys, crs="wgs84"))
+
+
+def load_region(region, query=None):
+    """Returns the union of a region's polygons. region is either the name of a GeoJSON file in
+    data/geojson or a GeoDataFrame, e.g. a sidt geocoder package returned with return_gdf=True.
+    query optionally filters the rows first, e.g. "country == 'United Kingdom'"."""
+    if isinstance(region, str):
+        region = gpd.read_file(os.path.join(data_dir, "geojson", region))
+    if query:
+        region = region.query(query)
+    return unary_union(region.to_crs("EPSG:4326").geometry)
+
+
+def cover_region(polygon, max_depth=9, min_depth=3):
+    """Returns a minimal non-overlapping list of quadkeys covering a polygon. Tiles fully inside the
+    polygon are kept as large as possible, tiles crossing its edge are split until max_depth.
+    Groups of four sibling tiles are merged into their parent, never above min_depth."""
+    shapely.prepare(polygon)
+    tiles = set()
+    level = np.array(list("0123"))
+
+    # Test each level's tiles against the region in one batch
+    depth = 1
+    while len(level):
+        boxes = quadkey_boxes(level)
+        intersecting = shapely.intersects(polygon, boxes)
+        level, boxes = level[intersecting], boxes[intersecting]
+        if depth >= min_depth:
+            keep = np.full(len(level), True) if depth >= max_depth else shapely.contains(polygon, boxes)
+            tiles.update(level[keep].tolist())
+            level = level[~keep]
+        level = np.char.add(np.repeat(level, 4), np.tile(list("0123"), len(level)))
+        depth += 1
+
+    # Merge complete groups of siblings, deepest first
+    for depth in range(max_depth, min_depth, -1):
+        parents = {tile[:-1] for tile in tiles if len(tile) == depth}
+        for parent in parents:
+            siblings = {parent + digit for digit in "0123"}
+            if siblings <= tiles:
+                tiles -= siblings
+                tiles.add(parent)
+
+    return sorted(tiles)
+
+
+def measure_tiles(tiles, polygon):
+    """Measures a list of quadkeys against a region, in km2 and starting requests.
+    Overlap is area searched more than once, wasted area is searched area outside the region."""
+    boxes = gpd.GeoSeries(quadkey_boxes(tiles), crs="EPSG:4326")
+    union = unary_union(boxes)
+    areas = gpd.GeoSeries([union, union.difference(polygon)], crs="EPSG:4326").to_crs(area_crs).area / 1e6
+    overlap = boxes.to_crs(area_crs).area.sum() / 1e6 - areas[0]
+
+    return {
+        "tiles": len(tiles),
+        "starting_requests": sum(len(MapsScraper.split_tiles_until_length(tile, 5)) for tile in tiles),
+        "searched_km2": round(areas[0]),
+        "wasted_km2": round(areas[1]),
+        "wasted_pct": round(100 * areas[1] / areas[0], 1) if areas[0] else 0,
+        "overlap_km2": round(overlap),
+    }
+
+
+def compile_tileset(name, region, query=None, max_depth=9, min_depth=3, compare_with=None, write=False):
+    """Compiles a tile set covering a region and reports it against the hand-assembled tile set
+    compare_with (defaults to name) in config.json. With write set, stores it as tile set name."""
+
+    config_path = os.path.join(data_dir, "config.json")
+    with open(config_path, "r") as json_file:
+        config_data = json.load(json_file)
+
+    polygon = load_region(region, query)
+    tiles = cover_region(polygon, max_depth=max_depth, min_depth=min_depth)
+
+    # Report against the current hand list
+    report = {"compiled": measure_tiles(tiles, polygon)}
+    current = config_data["tile_sets"].get(compare_with or name)
+    if current:
+        report["current"] = measure_tiles(current["tiles"], polygon)
+        report["starting_requests_saved"] = report["current"]["starting_requests"] - report["compiled"]["starting_requests"]
+        report["wasted_km2_saved"] = report["current"]["wasted_km2"] - report["compiled"]["wasted_km2"]
+    print(json.dumps(report, indent=4))
+
+    if write:
+        config_data["tile_sets"][name] = {"name": name, "tiles": tiles}
+        with open(config_path, "w") as json_file:
+            json.dump(config_data, json_file, indent=4)
+
+    return tiles, report
+
+
+if __name__ == "__main__":
+    compile_tileset("uk", "countries.geojson", query="country == 'United Kingdom'", write=False)
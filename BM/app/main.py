@@ -1,25 +1,60 @@
+import cProfile
+import csv
+import functools
+import importlib
 import json
+import multiprocessing
 import os
+import pstats
 import time
+import queue
 import requests
+import socket
+import sqlite3
 import sys
-from io import BytesIO
-from PIL import Image
+import threading
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from itertools import product
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
+import numpy as np
 
-from matplotlib.colors import to_rgba
-from matplotlib.patches import Rectangle
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 from tqdm import tqdm
 
 from sidt.utils.os import get_current_path, open_dir, get_root_path
 from sidt.utils.data import flatten_structure
 from sidt.utils.decorators import retry
-from sidt.utils.git import GitController
-from sidt.utils.io import XLWriter
+
+
+class LazyModule():
+    """Stands in for a module that is only imported when one of its attributes is first used.
+    Plotting, imagery and pandas are only needed by some stages, so importing them lazily keeps
+    startup fast for headless scrapes and short reruns."""
+
+    def __init__(self, name):
+        """name is the full name of the module, e.g. matplotlib.pyplot"""
+        self.__name = name
+
+
+    def __getattr__(self, attr):
+        """Imports the module and copies its attributes, so later lookups skip this method"""
+        module = importlib.import_module(self.__name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+plt = LazyModule("matplotlib.pyplot")
+mcolors = LazyModule("matplotlib.colors")
+mpatches = LazyModule("matplotlib.patches")
+mtransforms = LazyModule("matplotlib.transforms")
+sns = LazyModule("seaborn")
+pd = LazyModule("pandas")
+Image = LazyModule("PIL.Image")
 
 
 class Utils():
@@ -43,15 +78,25 @@ class Utils():
         return item
 
 
+    # Columns read as strings so IDs and quadkeys keep their leading zeros
+    str_columns = {"id": str, "category_id": str, "tile_set": str, "tile_id": str, "tile_parent_id": str}
+
+
     @staticmethod
     def load_data(filepath):
         """Loads results directly from csv file, useful for debugging 
         geocoding method, or rerunning geocoding with different params"""
-        df = pd.read_csv(filepath)
+        df = pd.read_csv(filepath, dtype=Utils.str_columns)
         data = df.to_dict(orient="records")
         return df, data
 
 
+    @staticmethod
+    def iter_data(filepath, chunksize=10000):
+        """Lazily reads results from a csv file, yielding dataframes of up to chunksize rows"""
+        yield from pd.read_csv(filepath, dtype=Utils.str_columns, chunksize=chunksize)
+
+
     @staticmethod
     def display_scatter(data):
         """Displays a scatter plot given a list of dictionaries"""
@@ -66,6 +111,7 @@ class Utils():
     @retry(n_attempts=3, require_input=IO_error)
     def save_dfs_to_xlsx(filepath, dfs):
         """Saves a list of dataframes to a csv file"""
+        from sidt.utils.io import XLWriter
         XLWriter.dfs_to_xlsx(dfs, filepath, wrap_cells=False)
 
 
@@ -76,6 +122,909 @@ class Utils():
         df.to_csv(filepath, index=False)
 
 
+class HTTPSession():
+    """Pooled keep-alive HTTP session shared by every worker and category, so TCP and TLS connections
+    to each host are reused instead of opened per tile. The visualiser's render process has its own."""
+
+    def __init__(self, pool_size=10):
+        """pool_size is the maximum number of open connections kept per host, it should be
+        at least the number of workers or requests will block waiting for a connection."""
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+
+    def get(self, url, **kwargs):
+        """Makes a GET request on a pooled connection"""
+        return self.session.get(url, **kwargs)
+
+
+    def stats(self):
+        """Returns connection reuse counters summed over the connection pools of each host"""
+        pools = self.adapter.poolmanager.pools
+        pools = [pool for pool in map(pools.get, pools.keys()) if pool is not None]
+        opened = sum(pool.num_connections for pool in pools)
+        made = sum(pool.num_requests for pool in pools)
+        return {
+            "requests": made,
+            "connections_opened": opened,
+            "connections_reused": made - opened,
+        }
+
+
+    def close(self):
+        """Closes all pooled connections"""
+        self.session.close()
+
+
+class ResponseCache():
+    """Persistent SQLite cache of API responses in the month's output folder, keyed on the request
+    params that determine the response. Entries expire after ttl_days and the least recently used
+    are evicted beyond max_size_mb. Safe to share between worker threads."""
+
+    key_params = ["tileId", "categoryid", "q", "chainid"]
+    evict_every = 1000
+
+    def __init__(self, filepath, ttl_days=31, max_size_mb=500):
+        """Opens or creates the cache database at filepath"""
+        self.ttl = ttl_days * 86400
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.writes = 0
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, body TEXT, size INTEGER, created REAL, accessed REAL)""")
+        self.conn.commit()
+        self.evict()
+
+
+    @staticmethod
+    def make_key(params):
+        """Builds the cache key from the params that affect the response"""
+        return "|".join(str(params.get(key, "")) for key in ResponseCache.key_params)
+
+
+    def get(self, params):
+        """Returns the cached response for params, or None if missing or expired"""
+        key = ResponseCache.make_key(params)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT body, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+
+    def set(self, params, response):
+        """Stores a response, evicting old entries every evict_every writes"""
+        key = ResponseCache.make_key(params)
+        body = json.dumps(response)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (key, body, len(body), now, now))
+            self.conn.commit()
+            self.writes += 1
+        if self.writes % ResponseCache.evict_every == 0:
+            self.evict()
+
+
+    def evict(self):
+        """Deletes expired entries, then the least recently used entries until the cache fits max_size"""
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self.evicted += cursor.rowcount
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+            excess = total - self.max_size
+            if excess > 0:
+                keys = []
+                for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    keys.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+                self.evicted += len(keys)
+            self.conn.commit()
+
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache"""
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "evicted": self.evicted,
+            "entries": entries,
+            "size_mb": round(size / 1024 / 1024, 2),
+        }
+
+
+    def close(self):
+        """Evicts old entries and closes the database"""
+        self.evict()
+        self.conn.close()
+
+
+class ImageCache():
+    """Persistent SQLite cache of Bing Maps imagery tiles for the visualiser's map overlay, shared by
+    all months and evicted beyond max_size_mb. Missing tiles are downloaded in parallel."""
+
+    url = "https://t.ssl.ak.dynamic.tiles.virtualearth.net/comp/ch/{quadkey}?{style}"
+    style = "mkt=en-GB&it=G,LC,BF,L,LA&shading=hill&jp=0&n=z&og=2390&cstl=s23&o=webp&ur=gb"
+
+    def __init__(self, filepath, session=None, style=None, max_size_mb=200, workers=8):
+        """Opens or creates the cache database at filepath"""
+        self.session = session or HTTPSession()
+        self.style = style or ImageCache.style
+        self.max_size = max_size_mb * 1024 * 1024
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(filepath)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS images (
+            key TEXT PRIMARY KEY, image BLOB, size INTEGER, accessed REAL)""")
+        self.conn.commit()
+
+
+    def make_key(self, quadkey):
+        """Builds the cache key from the quadkey and imagery style"""
+        return f"{self.style}|{quadkey}"
+
+
+    def download(self, quadkey):
+        """Downloads the imagery tile for a quadkey, returns None if unavailable"""
+        try:
+            response = self.session.get(ImageCache.url.format(quadkey=quadkey, style=self.style))
+        except RequestException:
+            return None
+        return response.content if response.status_code == 200 else None
+
+
+    def fetch(self, quadkeys):
+        """Returns a dict of quadkey: PIL image, from the cache where possible and otherwise downloaded
+        in parallel and cached. Tiles that could not be downloaded are left out."""
+        quadkeys = set(quadkeys)
+        images = {}
+        now = time.time()
+        for quadkey in quadkeys:
+            row = self.conn.execute("SELECT image FROM images WHERE key = ?", (self.make_key(quadkey),)).fetchone()
+            if row:
+                images[quadkey] = row[0]
+                self.conn.execute("UPDATE images SET accessed = ? WHERE key = ?", (now, self.make_key(quadkey)))
+        self.hits += len(images)
+
+        # Download missing tiles in parallel
+        missing = [quadkey for quadkey in quadkeys if quadkey not in images]
+        self.misses += len(missing)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for quadkey, image in zip(missing, executor.map(self.download, missing)):
+                if image:
+                    images[quadkey] = image
+                    self.conn.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                                      (self.make_key(quadkey), image, len(image), now))
+        self.conn.commit()
+        if missing:
+            self.evict()
+
+        return {quadkey: Image.open(BytesIO(image)) for quadkey, image in images.items()}
+
+
+    def evict(self):
+        """Deletes the least recently used tiles until the cache fits max_size"""
+        excess = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0] - self.max_size
+        if excess > 0:
+            keys = []
+            for key, size in self.conn.execute("SELECT key, size FROM images ORDER BY accessed"):
+                keys.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self.conn.executemany("DELETE FROM images WHERE key = ?", keys)
+            self.conn.commit()
+
+
+    def close(self):
+        """Closes the database"""
+        self.conn.close()
+
+
+class Quadkey():
+    """Vectorised conversions between Bing Maps quadkeys, tile bounds and coordinates using NumPy.
+    Quadkeys interleave the bits of the tile x and y coordinates, one digit per level."""
+
+    max_lat = 85.05112878
+    earth_radius = 6378137.0
+
+    @staticmethod
+    def to_keys(quadkeys):
+        """Converts quadkey strings to integer keys and levels, as uint64 arrays"""
+        quadkeys = np.asarray(quadkeys, dtype="S")
+        width = max(quadkeys.dtype.itemsize, 1)
+        digits = quadkeys.astype(f"S{width}").view(np.uint8).reshape(len(quadkeys), width).astype(np.uint64)
+        valid = digits != 0
+        keys = np.zeros(len(quadkeys), dtype=np.uint64)
+        for i in range(width):
+            keys = np.where(valid[:, i], keys * np.uint64(4) + digits[:, i] - np.uint64(48), keys)
+        return keys, valid.sum(axis=1).astype(np.uint64)
+
+
+    @staticmethod
+    def to_strings(keys, levels):
+        """Converts integer keys and levels back to quadkey strings"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        levels = np.asarray(levels, dtype=np.int64)
+        width = max(int(levels.max(initial=0)), 1)
+        digits = np.zeros((len(keys), width), dtype=np.uint8)
+        for i in range(width):
+            shift = np.clip(2 * (levels - 1 - i), 0, None).astype(np.uint64)
+            digit = ((keys >> shift) & np.uint64(3)).astype(np.uint8) + 48
+            digits[:, i] = np.where(i < levels, digit, 0)
+        return digits.view(f"S{width}").ravel().astype(str)
+
+
+    @staticmethod
+    def to_tile_xy(keys, levels):
+        """De-interleaves integer keys into tile x and y coordinates at their level"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        x = np.zeros(len(keys), dtype=np.uint64)
+        y = np.zeros(len(keys), dtype=np.uint64)
+        for i in range(int(np.max(levels, initial=0))):
+            digit = (keys >> np.uint64(2 * i)) & np.uint64(3)
+            x |= (digit & np.uint64(1)) << np.uint64(i)
+            y |= (digit >> np.uint64(1)) << np.uint64(i)
+        return x, y
+
+
+    @staticmethod
+    def from_tile_xy(x, y, level):
+        """Interleaves tile x and y coordinates at a level into integer keys"""
+        x = np.asarray(x, dtype=np.uint64)
+        y = np.asarray(y, dtype=np.uint64)
+        keys = np.zeros(len(x), dtype=np.uint64)
+        for i in range(level):
+            keys |= ((x >> np.uint64(i)) & np.uint64(1)) << np.uint64(2 * i)
+            keys |= ((y >> np.uint64(i)) & np.uint64(1)) << np.uint64(2 * i + 1)
+        return keys
+
+
+    @staticmethod
+    def to_bounds(quadkeys, crs="wgs84"):
+        """Converts quadkeys to their bounds, returned as arrays (x1, y1, x2, y2) with x1 < x2 and
+        y1 < y2. crs is "wgs84" for longitude/latitude, "mercator" for Web Mercator metres or
+        "normalised" for 0-1 coordinates with y increasing northwards, as used by TilePlot."""
+        keys, levels = Quadkey.to_keys(quadkeys)
+        x, y = Quadkey.to_tile_xy(keys, levels)
+        n = np.exp2(levels.astype(np.float64))
+        x1, x2 = x / n, (x + 1) / n
+        y_top, y_bottom = y / n, (y + 1) / n
+
+        if crs == "normalised":
+            return x1, 1 - y_bottom, x2, 1 - y_top
+        if crs == "mercator":
+            extent = np.pi * Quadkey.earth_radius
+            return (2 * x1 - 1) * extent, (1 - 2 * y_bottom) * extent, (2 * x2 - 1) * extent, (1 - 2 * y_top) * extent
+        if crs == "wgs84":
+            def lat(y):
+                return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y))))
+            return x1 * 360 - 180, lat(y_bottom), x2 * 360 - 180, lat(y_top)
+        raise ValueError(f"Unknown crs: {crs}")
+
+
+    @staticmethod
+    def from_points(latitudes, longitudes, level):
+        """Returns the quadkeys of the tiles at a level containing each latitude/longitude point"""
+        lat = np.radians(np.clip(np.asarray(latitudes, dtype=np.float64), -Quadkey.max_lat, Quadkey.max_lat))
+        lon = np.asarray(longitudes, dtype=np.float64)
+        n = 2 ** level
+        x = np.clip(np.floor((lon + 180) / 360 * n), 0, n - 1)
+        y = np.clip(np.floor((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n), 0, n - 1)
+        keys = Quadkey.from_tile_xy(x, y, level)
+        return Quadkey.to_strings(keys, np.full(len(keys), level))
+
+
+class Tile():
+    """Compact frontier record for a search tile. The quadkey is stored as an integer with its
+    level so leading zeros survive, the tile set name and parent tile ID are interned as indexes
+    into a shared table. Dicts are only materialised when results are emitted or checkpointed."""
+
+    __slots__ = ("key", "level", "tile_set_i", "parent_i")
+
+    names = []
+    name_index = {}
+
+    def __init__(self, key, level, tile_set_i, parent_i):
+        self.key = key
+        self.level = level
+        self.tile_set_i = tile_set_i
+        self.parent_i = parent_i
+
+
+    @staticmethod
+    def intern(name):
+        """Returns the index of a string in the shared name table, adding it if needed"""
+        if name not in Tile.name_index:
+            Tile.name_index[name] = len(Tile.names)
+            Tile.names.append(name)
+        return Tile.name_index[name]
+
+
+    @classmethod
+    def from_id(cls, tile_id, tile_set, tile_parent_id):
+        """Creates a record from a quadkey string and its tile set and parent tile IDs"""
+        return cls(int(tile_id, 4) if tile_id else 0, len(tile_id), Tile.intern(tile_set), Tile.intern(tile_parent_id))
+
+
+    @classmethod
+    def from_dict(cls, tile):
+        """Creates a record from a tile dictionary"""
+        return cls.from_id(tile["tile_id"], tile["tile_set"], tile["tile_parent_id"])
+
+
+    @property
+    def tile_id(self):
+        """Quadkey string of the tile, one digit from 0 to 3 per level"""
+        digits = []
+        key = self.key
+        for _ in range(self.level):
+            key, digit = divmod(key, 4)
+            digits.append("0123"[digit])
+        return "".join(reversed(digits))
+
+
+    @property
+    def tile_set(self):
+        return Tile.names[self.tile_set_i]
+
+
+    @property
+    def tile_parent_id(self):
+        return Tile.names[self.parent_i]
+
+
+    def children(self):
+        """Returns the four subtiles, which keep the tile set and parent of this tile"""
+        key = self.key * 4
+        return [Tile(key + i, self.level + 1, self.tile_set_i, self.parent_i) for i in range(4)]
+
+
+    def descendants(self, level):
+        """Lazily yields every subtile at the given level in quadkey order, or the tile itself
+        if it is already that deep. Descendant keys are a contiguous integer range."""
+        if level <= self.level:
+            yield self
+            return
+        n = 4 ** (level - self.level)
+        key = self.key * n
+        for i in range(n):
+            yield Tile(key + i, level, self.tile_set_i, self.parent_i)
+
+
+    def to_dict(self):
+        """Materialises the record as the tile dictionary attached to results"""
+        return {
+            "tile_set": self.tile_set,
+            "tile_id": self.tile_id,
+            "tile_parent_id": self.tile_parent_id,
+        }
+
+
+class Checkpoint():
+    """Append-only JSON lines log of a category's search in the project folder, recording each
+    processed tile with the subtiles it queued and the results it stored, so an interrupted run
+    can carry on without re-requesting completed tiles."""
+
+    flush_every = 100
+    flush_interval = 10
+
+    def __init__(self, filepath, header, resume=True):
+        """Loads an existing log at filepath if resume is set and it was written with the same
+        header, otherwise moves any existing log aside and starts a new one. Check self.resumed to
+        see whether state was loaded."""
+        header = json.loads(json.dumps(header))  # Compared with the header as read back from JSON
+        self.filepath = filepath
+        self.buffer = []
+        self.last_flush = time.time()
+        self.tiles = []
+        self.results = []
+        self.completed = set()
+        self.complete = False
+        self.resumed = resume and os.path.exists(filepath) and self.load(header)
+
+        if not self.resumed:
+            if os.path.exists(filepath):
+                root, ext = os.path.splitext(filepath)
+                moved = f"{root}-{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+                os.replace(filepath, moved)
+                tqdm.write(f"Checkpoint {filepath} was not resumed, moved it to {moved}")
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, "w") as file:
+                file.write(json.dumps({"type": "header", **header}) + "\n")
+
+
+    def load(self, header):
+        """Replays the log to rebuild the pending frontier, completed tile IDs and stored results.
+        Returns False if the log belongs to a search with different params."""
+        pending = {}
+        with open(self.filepath, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Partially written final line
+                
+                if record["type"] == "header":
+                    if {key: record.get(key) for key in header} != header:
+                        return False
+                elif record["type"] == "frontier":
+                    for tile in record["tiles"]:
+                        pending.setdefault(tile["tile_id"], tile)
+                elif record["type"] == "tile":
+                    tile = record["tile"]
+                    self.completed.add(tile["tile_id"])
+                    pending.pop(tile["tile_id"], None)
+                    for tile_id in record["new_tiles"]:
+                        pending.setdefault(tile_id, dict(tile, tile_id=tile_id))
+                    self.results.extend(record["results"])
+                elif record["type"] == "complete":
+                    self.complete = True
+
+        self.tiles = [tile for tile_id, tile in pending.items() if tile_id not in self.completed]
+        return True
+    
+
+    def write(self, record):
+        """Buffers a record, flushing when the batch is full or the interval has passed"""
+        self.buffer.append(record)
+        if len(self.buffer) >= Checkpoint.flush_every or time.time() - self.last_flush > Checkpoint.flush_interval:
+            self.flush()
+
+
+    def record_frontier(self, tiles):
+        """Records the initial frontier of a new search"""
+        self.write({"type": "frontier", "tiles": [tile.to_dict() for tile in tiles]})
+
+
+    def record_tile(self, tile, new_tiles, results):
+        """Records a processed tile, the subtiles it added to the frontier and the results it stored.
+        Subtiles share the tile set and parent of the tile, so only their IDs are written."""
+        self.write({
+            "type": "tile",
+            "tile": tile.to_dict(),
+            "new_tiles": [new_tile.tile_id for new_tile in new_tiles],
+            "results": results,
+        })
+
+
+    def flush(self):
+        """Appends buffered records to the log and syncs it to disk"""
+        if self.buffer:
+            with open(self.filepath, "a") as file:
+                file.write("".join(json.dumps(record) + "\n" for record in self.buffer))
+                file.flush()
+                os.fsync(file.fileno())
+            self.buffer = []
+        self.last_flush = time.time()
+
+
+    def leaves(self):
+        """Flushes the log and returns the leaf tiles of the search, see read_leaves"""
+        self.flush()
+        return Checkpoint.read_leaves(self.filepath)
+
+
+    @staticmethod
+    def read_leaves(filepath):
+        """Replays a log to find the leaf tiles of the search, those whose results were stored or
+        that were found to be empty rather than split. Returns a dict of leaf tile ID to the list
+        of result ids stored for it."""
+        leaves = {}
+        with open(filepath, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record["type"] != "tile":
+                    continue
+
+                # Results may come from subtiles fetched while verifying a zero result
+                tile_id = record["tile"]["tile_id"]
+                if not record["new_tiles"] and all(result["tile_id"] == tile_id for result in record["results"]):
+                    leaves.setdefault(tile_id, [])
+                for result in record["results"]:
+                    leaves.setdefault(result["tile_id"], []).append(result.get("id"))
+        return leaves
+
+
+    def close(self):
+        """Marks the search as complete and flushes remaining records"""
+        if not self.complete:
+            self.write({"type": "complete"})
+            self.complete = True
+        self.flush()
+
+
+class ResultWriter():
+    """Streams deduplicated results to scraped.csv in the project folder as tiles complete,
+    buffering them and appending in batches, so results are neither held in memory in full
+    nor rewritten with each category. Optionally converts the csv to a Parquet file on close."""
+
+    def __init__(self, filepath, formats=("csv",), batch_size=500):
+        """Starts a new csv file at filepath. formats may also include "parquet",
+        which requires pyarrow, to write a Parquet copy alongside the csv."""
+        self.filepath = filepath
+        self.formats = formats
+        self.batch_size = batch_size
+        self.fieldnames = []
+        self.buffer = []
+        self.count = 0
+
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+
+    def write(self, results):
+        """Buffers results, flushing once a batch is full"""
+        self.buffer.extend(results)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+
+    def flush(self):
+        """Appends buffered results to the csv file, widening its header if new columns appear"""
+        if not self.buffer:
+            return
+
+        new_fields = [key for key in dict.fromkeys(key for result in self.buffer for key in result) if key not in self.fieldnames]
+        if new_fields:
+            self.widen(self.fieldnames + new_fields)
+
+        with open(self.filepath, "a", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=self.fieldnames)
+            if self.count == 0:
+                writer.writeheader()
+            writer.writerows(self.buffer)
+        self.count += len(self.buffer)
+        self.buffer = []
+
+
+    def widen(self, fieldnames):
+        """Sets the csv columns, rewriting rows already written under the new header"""
+        if self.count:
+            temp_path = self.filepath + ".tmp"
+            with open(self.filepath, "r", newline="", encoding="utf-8") as src, \
+                 open(temp_path, "w", newline="", encoding="utf-8") as dst:
+                writer = csv.DictWriter(dst, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(csv.DictReader(src))
+            os.replace(temp_path, self.filepath)
+        self.fieldnames = fieldnames
+
+
+    def write_parquet(self):
+        """Converts the csv to Parquet chunk by chunk, with numeric coordinates and string columns"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("pyarrow is not installed, skipping Parquet output.")
+            return
+
+        writer = None
+        for chunk in pd.read_csv(self.filepath, dtype=str, keep_default_na=False, chunksize=50000):
+            for col in ["latitude", "longitude"]:
+                if col in chunk:
+                    chunk[col] = pd.to_numeric(chunk[col], errors="coerce")
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(os.path.splitext(self.filepath)[0] + ".parquet", table.schema)
+            writer.write_table(table)
+        if writer:
+            writer.close()
+
+
+    def close(self):
+        """Flushes remaining results and writes any additional formats"""
+        self.flush()
+        if self.count and "parquet" in self.formats:
+            self.write_parquet()
+
+
+class RateLimiter():
+    """Thread-safe token bucket that every API request goes through, shared by all workers and
+    categories. The rate is halved on HTTP 429/5xx responses and recovers additively while
+    responses are clean, so the scraper runs close to the maximum rate the API tolerates."""
+
+    def __init__(self, rate=10, burst=10, min_rate=0.5, backoff=0.5, recovery=0.1):
+        """rate is the target requests per second, burst the number of requests that may be
+        made back to back. On throttling the rate is multiplied by backoff (never below min_rate),
+        each clean response adds recovery requests per second until rate is reached again."""
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.recovery = recovery
+
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+
+    def refill(self):
+        """Adds the tokens accumulated since the last update, must be called holding the lock"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    def acquire(self):
+        """Blocks until a token is available and consumes it"""
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+    def feedback(self, status_code, retry_after=None):
+        """Adapts the rate to the status code of a response. Throttled responses drain the
+        bucket, and a numeric Retry-After header pauses all requests for that many seconds."""
+        with self.lock:
+            self.refill()
+            if status_code == 429 or status_code >= 500:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate * self.backoff)
+                self.tokens = min(self.tokens, 0)
+                if retry_after and str(retry_after).isdigit():
+                    self.tokens = -int(retry_after) * self.rate
+            else:
+                self.rate = min(self.max_rate, self.rate + self.recovery)
+
+
+class Metrics():
+    """Thread-safe instrumentation of a scrape, shared by every worker and category. Records request
+    latencies, status codes, retries and bytes, time per stage and the decision made for each tile.
+    Snapshots are exported to filepath, as Prometheus text if it ends in .prom or JSON lines otherwise."""
+
+    latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, filepath=None, interval=10):
+        """Starts recording, the run's elapsed time is measured from here. An existing export at
+        filepath is replaced."""
+        self.filepath = filepath
+        self.interval = interval
+        self.start = time.time()
+        self.last_export = self.start
+
+        self.latency_counts = [0] * (len(Metrics.latency_buckets) + 1)
+        self.latency_sum = 0
+        self.status_codes = Counter()
+        self.attempts = 0
+        self.fetches = 0
+        self.bytes = 0
+        self.stage_time = Counter()
+        self.stage_calls = Counter()
+        self.decisions = Counter()
+        self.lock = threading.Lock()
+
+        if filepath and os.path.exists(filepath):
+            os.remove(filepath)
+
+
+    def record_request(self, latency, status_code, n_bytes):
+        """Records one request attempt, status_code is "error" for requests that got no response"""
+        with self.lock:
+            self.latency_counts[bisect_left(Metrics.latency_buckets, latency)] += 1
+            self.latency_sum += latency
+            self.status_codes[str(status_code)] += 1
+            self.attempts += 1
+            self.bytes += n_bytes
+            self.stage_time["request"] += latency
+            self.stage_calls["request"] += 1
+
+
+    def record_fetch(self):
+        """Records a response that was requested from the API rather than the cache, any further
+        attempts made by get_response are counted as retries"""
+        with self.lock:
+            self.fetches += 1
+
+
+    def record_decision(self, decision, tile):
+        """Records the outcome of a tile (stored, split, empty, zero_verified or dense_skip) at its depth"""
+        with self.lock:
+            self.decisions[(decision, len(tile.tile_id))] += 1
+
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager adding the time spent within it to a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stage_time[stage] += elapsed
+                self.stage_calls[stage] += 1
+
+
+    def summary(self):
+        """Returns the metrics recorded so far as a dict"""
+        with self.lock:
+            latencies = dict(zip([str(bucket) for bucket in Metrics.latency_buckets] + ["inf"], self.latency_counts))
+            return {
+                "elapsed_s": round(time.time() - self.start, 3),
+                "requests": self.attempts,
+                "retries": max(0, self.attempts - self.fetches),
+                "bytes": self.bytes,
+                "status_codes": dict(self.status_codes),
+                "latency_mean_s": round(self.latency_sum / self.attempts, 4) if self.attempts else None,
+                "latency_histogram": latencies,
+                "stage_s": {stage: round(seconds, 3) for stage, seconds in self.stage_time.items()},
+                "stage_calls": dict(self.stage_calls),
+                "decisions": {f"{decision}|{depth}": count for (decision, depth), count in sorted(self.decisions.items())},
+            }
+
+
+    def to_prometheus(self):
+        """Returns the metrics recorded so far in the Prometheus text exposition format"""
+        with self.lock:
+            lines = ["# TYPE bm_request_latency_seconds histogram"]
+            cumulative = 0
+            for bucket, count in zip(list(Metrics.latency_buckets) + ["+Inf"], self.latency_counts):
+                cumulative += count
+                lines.append(f'bm_request_latency_seconds_bucket{{le="{bucket}"}} {cumulative}')
+            lines.append(f"bm_request_latency_seconds_sum {self.latency_sum}")
+            lines.append(f"bm_request_latency_seconds_count {self.attempts}")
+
+            lines.append("# TYPE bm_responses_total counter")
+            lines.extend(f'bm_responses_total{{status="{status}"}} {count}' for status, count in self.status_codes.items())
+            lines.append("# TYPE bm_request_retries_total counter")
+            lines.append(f"bm_request_retries_total {max(0, self.attempts - self.fetches)}")
+            lines.append("# TYPE bm_response_bytes_total counter")
+            lines.append(f"bm_response_bytes_total {self.bytes}")
+
+            lines.append("# TYPE bm_stage_seconds_total counter")
+            lines.extend(f'bm_stage_seconds_total{{stage="{stage}"}} {seconds}' for stage, seconds in self.stage_time.items())
+            lines.append("# TYPE bm_stage_calls_total counter")
+            lines.extend(f'bm_stage_calls_total{{stage="{stage}"}} {count}' for stage, count in self.stage_calls.items())
+
+            lines.append("# TYPE bm_tile_decisions_total counter")
+            lines.extend(f'bm_tile_decisions_total{{decision="{decision}",depth="{depth}"}} {count}'
+                         for (decision, depth), count in sorted(self.decisions.items()))
+            lines.append("# TYPE bm_elapsed_seconds gauge")
+            lines.append(f"bm_elapsed_seconds {time.time() - self.start}")
+        return "\n".join(lines) + "\n"
+
+
+    def export(self, force=False):
+        """Exports a snapshot to filepath if one is set and the interval has passed since the last"""
+        if not self.filepath or (not force and time.time() - self.last_export < self.interval):
+            return
+        self.last_export = time.time()
+
+        if self.filepath.endswith(".prom"):
+            # Replaced atomically so collectors never read a partial file
+            temp_path = self.filepath + ".tmp"
+            with open(temp_path, "w") as file:
+                file.write(self.to_prometheus())
+            os.replace(temp_path, self.filepath)
+        else:
+            with open(self.filepath, "a") as file:
+                file.write(json.dumps(self.summary()) + "\n")
+
+
+class DensityMap():
+    """Per-quadkey counts of the categories of a run that hit the result cap on a tile and that did not,
+    used to skip tiles that are known to be dense. Leaf tiles of completed searches are kept in SQLite
+    at filepath to seed the next run of the same search."""
+
+    def __init__(self, threshold=0, filepath=None, seed=True):
+        """A tile is dense once at least threshold categories hit the cap on it and none found
+        it under the cap. A threshold of 0, the default, disables skipping. Leaves are stored at filepath,
+        and used to seed frontiers if seed is set."""
+        self.threshold = threshold
+        self.capped = Counter()
+        self.uncapped = Counter()
+        self.seed_frontier = seed
+
+        # The rollback journal is kept and writers wait on each other, so shard workers can share the file
+        self.conn = None
+        if filepath:
+            self.conn = sqlite3.connect(filepath, timeout=60)
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS leaves (
+                category_id TEXT, search TEXT, tile_id TEXT, n_results INTEGER, updated REAL,
+                PRIMARY KEY (category_id, search, tile_id))""")
+            self.conn.commit()
+
+
+    def record(self, tile, n_results):
+        """Records the result count of a searched tile. Zero counts are ignored as the API
+        sometimes returns no results for tiles that have some."""
+        if n_results >= MapsScraper.result_cap:
+            self.capped[(tile.level, tile.key)] += 1
+        elif n_results > 0:
+            self.uncapped[(tile.level, tile.key)] += 1
+
+
+    def is_dense(self, tile):
+        """Returns True if the tile is known to be over the cap for this kind of search"""
+        key = (tile.level, tile.key)
+        return bool(self.threshold) and self.capped[key] >= self.threshold and not self.uncapped[key]
+
+
+    @staticmethod
+    def covers(tile_id, leaf_ids):
+        """Returns True if the leaf tiles exactly cover the tile, i.e. their areas sum to its area"""
+        depth = max(len(leaf_id) for leaf_id in leaf_ids) - len(tile_id)
+        area = sum(4 ** (depth - len(leaf_id) + len(tile_id)) for leaf_id in leaf_ids)
+        return area == 4 ** depth
+
+
+    def seed(self, tiles, category_id, search):
+        """Replaces each tile by the leaf tiles the last completed run of the same search needed
+        under it, if they cover it exactly. Leaves that are now over the cap are split as usual."""
+        if not self.conn or not self.seed_frontier:
+            return list(tiles)
+
+        leaf_ids = [row[0] for row in self.conn.execute(
+            "SELECT tile_id FROM leaves WHERE category_id = ? AND search = ?", (category_id, search))]
+        return DensityMap.seed_tiles(tiles, leaf_ids)
+
+
+    @staticmethod
+    def seed_tiles(tiles, leaf_ids):
+        """Replaces each tile by the given leaf tiles under it, if they cover it exactly"""
+        leaf_ids = sorted(leaf_ids)
+        seeded = []
+        for tile in tiles:
+            # Quadkey digits sort below "4", so this slices out the leaves under the tile
+            tile_id = tile.tile_id
+            under = leaf_ids[bisect_left(leaf_ids, tile_id):bisect_left(leaf_ids, tile_id + "4")]
+            if under and DensityMap.covers(tile_id, under):
+                seeded.extend(Tile.from_id(leaf_id, tile.tile_set, tile.tile_parent_id) for leaf_id in under)
+            else:
+                seeded.append(tile)
+        return seeded
+
+
+    def save_leaves(self, category_id, search, leaves, initial_tiles):
+        """Replaces the stored leaves under the initial tiles of a completed search with its new leaves"""
+        if not self.conn:
+            return
+        now = time.time()
+        with self.conn:
+            for tile_id in {tile.tile_id for tile in initial_tiles}:
+                self.conn.execute("DELETE FROM leaves WHERE category_id = ? AND search = ? AND tile_id >= ? AND tile_id < ?",
+                                  (category_id, search, tile_id, tile_id + "4"))
+            self.conn.executemany("INSERT OR REPLACE INTO leaves VALUES (?, ?, ?, ?, ?)",
+                                  [(category_id, search, tile_id, len(ids), now) for tile_id, ids in leaves.items()])
+
+
 class MapsScraper():
     """Class for handling the scraper Bing Maps scraper itself"""
 
@@ -96,16 +1045,43 @@ class MapsScraper():
     url = "https://www.bingapis.com/api/v7/micropoi"
 
     result_cap = 100
-    sleep_duration = 0.1
+
+    # Params that may be left out, only category_id, tile_sets and checkpoint are required
+    default_params = {
+        "app_id": "",
+        "url": None,
+        "category_id_i": 0,
+        "chain_id": "",
+        "search_term": "",
+        "visualiser_settings": {"display": False},
+        "workers": 1,
+        "rate_limiter": None,
+        "session": None,
+        "cache": None,
+        "previous_checkpoint": None,
+        "resume": True,
+        "seen_ids": None,
+        "writer": None,
+        "density": None,
+        "metrics": None,
+        "initial_tiles": None,
+        "prog_bar": None,
+    }
 
     def __init__(self, params):
-        """Initialises the scraper and visualisation if needed"""
+        """Initialises the scraper for a single category. Collaborators that are not given,
+        the rate limiter, session and metrics, are created for this scraper alone."""
+        params = {**MapsScraper.default_params, **params}
         self.visualiser_settings = params["visualiser_settings"]
-        self.prog_bar = tqdm(dynamic_ncols=True) 
+        self.workers = params["workers"]
+        self.rate_limiter = params["rate_limiter"] if params["rate_limiter"] is not None else RateLimiter()
+        self.session = params["session"] if params["session"] is not None else HTTPSession(pool_size=max(self.workers, 10))
+        self.cache = params["cache"]
+        self.writer = params["writer"]
+        self.density = params["density"]
+        self.metrics = params["metrics"] if params["metrics"] is not None else Metrics()
+        self.prog_bar = params["prog_bar"] if params["prog_bar"] is not None else tqdm(dynamic_ncols=True)
         self.init_scraper(params)
-
-        if self.visualiser_settings["display"]:
-            self.tile_plot = TilePlot(initial_tiles=self.initial_tiles, settings=self.visualiser_settings)
     
 
     def log(self, status):
@@ -114,44 +1090,64 @@ class MapsScraper():
         self.prog_bar.set_description(status)
 
 
-    def init_scraper(self, params):
-        """Initialises the scraper by processing the input parameters including tilesets and API params"""
+    @staticmethod
+    def load_tiles(tile_set_names):
+        """Loads the given tile sets from config.json and expands them into a list of Tile records,
+        splitting tiles until all are at least 5 digits long. Shared by all categories of a run."""
 
         # Load location data
-        self.log("Initialising scraper")
         with open(os.path.join(App.data_dir, "config.json"), "r") as file:
             all_tile_sets = json.load(file)["tile_sets"]
-            tile_sets = {key: val for key, val in all_tile_sets.items() if key in params["tile_sets"]}
+            tile_sets = {key: val for key, val in all_tile_sets.items() if key in tile_set_names}
 
-        # Prepare tiles
-        self.tiles = []
-        for tile_set in tile_sets.values():
-            for tile in tile_set["tiles"]:
-
-                # Ensure all tiles are at least 5 digits long
-                if len(tile) >= 5:
-                    self.tiles.append({
-                        "tile_set": tile_set["name"],
-                        "tile_id": tile,
-                        "tile_parent_id": tile
-                    })
-                
-                # Split tiles into subtiles until all are 5 digits long
-                else:
-                    new_tiles = self.split_tiles_until_length(tile, 5)
-                    for new_tile in new_tiles:
-                        self.tiles.append({
-                            "tile_set": tile_set["name"],
-                            "tile_id": new_tile,
-                            "tile_parent_id": tile
-                        })
-
-        self.initial_tiles = self.tiles
+        # Drop tiles that are already covered by another requested tile
+        configured = [(tile, tile_set["name"]) for tile_set in tile_sets.values() for tile in tile_set["tiles"]]
+        configured, avoided = MapsScraper.normalise_tiles(configured)
+        if avoided:
+            tqdm.write(f"Removed overlapping tiles from tile sets, avoiding {avoided} starting requests")
+
+        # Split tiles into subtiles until all are at least 5 digits long
+        tiles = []
+        for tile, tile_set_name in configured:
+            tiles.extend(Tile.from_id(tile, tile_set_name, tile).descendants(5))
+        return tiles
+
+
+    @staticmethod
+    def normalise_tiles(tiles):
+        """Receives a list of (tile_id, tile_set_name) pairs, possibly from overlapping tile sets, and drops
+        duplicates and tiles covered by an ancestor tile. Returns the kept pairs in their original order
+        and the number of starting requests avoided."""
+
+        order = {pair: i for i, pair in reversed(list(enumerate(tiles)))}
+        kept, avoided = [], 0
+        for tile, tile_set_name in sorted(order, key=lambda pair: (pair[0], order[pair])):
+            if kept and tile.startswith(kept[-1][0]):
+                avoided += 4 ** max(0, 5 - len(tile))
+                continue
+            kept.append((tile, tile_set_name))
+
+        return sorted(kept, key=order.get), avoided
+
+
+    def init_scraper(self, params):
+        """Initialises the scraper by processing the input parameters including tilesets and API params.
+        initial_tiles may be given to share one tile expansion between categories, and url points
+        the requests at another micropoi endpoint, e.g. the mock API used for benchmarks."""
+
+        # Prepare tiles, the frontier is a queue of compact Tile records
+        self.log("Initialising scraper")
+        self.initial_tiles = params["initial_tiles"] or MapsScraper.load_tiles(params["tile_sets"])
+        self.tiles = deque(self.initial_tiles)
         self.new_tiles = []
+        self.in_flight = 0
+        self.finished = False
         
         # Initialise API params
         self.category_id = params["category_id"]
         self.category_id_i = params["category_id_i"]
+        self.search = f"{params['search_term']}|{params['chain_id']}"
+        self.url = params["url"] or MapsScraper.url
         self.params = {
             "tileId": "",
             "q": params["search_term"],
@@ -160,188 +1156,484 @@ class MapsScraper():
             "appid": params["app_id"],
         }
 
+        # Results are deduplicated by id as they arrive, seen_ids may be shared between categories.
+        # Results are streamed to the writer if one is given, otherwise kept in all_results
         self.all_results = []
+        self.stored = []
+        self.n_results = 0
+        self.seen_ids = params["seen_ids"] if params["seen_ids"] is not None else set()
+        self.duplicates = Counter()
+        self.requests_saved = 0
+        self.density_skips = 0
+        self.capped_ids = set()
+
+        # Resume from the checkpoint of an interrupted search, or record the initial frontier
+        self.checkpoint = Checkpoint(
+            filepath=params["checkpoint"],
+            header={key: params[key] for key in ["category_id", "tile_sets", "search_term", "chain_id"]},
+            resume=params["resume"],
+        )
+        if self.checkpoint.resumed:
+            self.tiles = deque(Tile.from_dict(tile) for tile in self.checkpoint.tiles)
+            self.store_results(None, self.checkpoint.results)
+            self.log(f"Resuming from checkpoint, {len(self.checkpoint.completed)} tiles already completed")
+        else:
+            # Incremental runs rescrape the leaf tiles of the previous project, otherwise
+            # start at the leaf depth that was sufficient in the last run of this search
+            if params["previous_checkpoint"]:
+                leaves = Checkpoint.read_leaves(params["previous_checkpoint"])
+                self.tiles = deque(DensityMap.seed_tiles(self.tiles, leaves))
+            elif self.density:
+                self.tiles = deque(self.density.seed(self.tiles, self.category_id, self.search))
+            self.checkpoint.record_frontier(self.tiles)
 
 
     def run(self):
-        """Runs the scraper, then cleans the results by removing duplicate results.
-        Returns a list of dictionaries containing all results"""
-
-        # Run the recursive_grid_search
-        start = time.time()
+        """Runs the scraper on its own. Results are deduplicated as they are stored. Returns a list
+        of dictionaries containing all results, which is empty if results were streamed to a writer.
+        The instrumentation of the run is left in self.metrics, see Metrics.summary."""
         self.log("Running scraper")
-        self.recursive_grid_search()
-
-        # Remove duplicate records
-        self.log("Removing duplicate records")
-        temp_df = pd.DataFrame(self.all_results)
-        temp_df_unique = temp_df.drop_duplicates(subset="id")
-        self.all_results = temp_df_unique.to_dict(orient="records")
-
-        # Complete
-        plt.close("all")
-
-        self.log(f"Scraper finished in {round(time.time()-start)}s")
+        Scheduler([self], workers=self.workers, visualiser_settings=self.visualiser_settings).run()
         return self.all_results
 
 
-    def recursive_grid_search(self):
-        """Iterates over all tiles given in each tileset in input params
-        Remaining tiles are stored in self.tiles, tiles are popped as they are processed"""
-
-        index = -1
-        while self.tiles:
-            index += 1
-            tile = self.tiles.pop(0)
-
-            # Update progress bar
-            self.prog_bar.update(1)
-            status = {
-                "Category ID": f"{self.category_id_i}: {self.category_id}",
-                "Tiles Completed": index,
-                "Tiles Remaining": len(self.tiles),
-                "Locations Found": len(self.all_results),
-                "Current Parent Tile": tile["tile_parent_id"],
-                "Current Search Tile": tile["tile_id"],
-                }
-            self.prog_bar.set_postfix(status)
-            
-            # Process the tile, get the data, ensure its validity
-            if self.visualiser_settings["display"]:
-                self.tile_plot.update_labels(status)
-                self.tile_plot.update(tile, self.new_tiles)
-            self.process_tile(tile)      
+    def finish(self):
+        """Marks the category's checkpoint complete once its frontier has drained"""
+        if self.finished:
+            return
+        self.finished = True
+        self.checkpoint.close()
+        if self.density:
+            self.density.save_leaves(self.category_id, self.search, self.checkpoint.leaves(), self.initial_tiles)
+        self.log(f"Category {self.category_id} finished with {self.n_results} locations, "
+                 f"{self.requests_saved} requests saved by reusing zero verification results, "
+                 f"{self.density_skips} dense tiles skipped, "
+                 f"{sum(self.duplicates.values())} duplicate records dropped")
+
+
+    def skip_dense_tile(self, tile):
+        """Skips the request for a tile that earlier categories found to be over the cap, if this category
+        found its parent over the cap too, queueing the subtiles directly. Returns True if skipped."""
+        if not self.density or tile.tile_id[:-1] not in self.capped_ids or not self.density.is_dense(tile):
+            return False
+        self.capped_ids.add(tile.tile_id)
+        self.new_tiles = self.split_tile(tile)
+        self.tiles.extend(self.new_tiles)
+        with self.metrics.time("save"):
+            self.checkpoint.record_tile(tile, self.new_tiles, [])
+        self.metrics.record_decision("dense_skip", tile)
+        self.density_skips += 1
+        return True
+
+
+    def complete_tile(self, tile, results, sub_tiles_results):
+        """Processes the responses for a tile, then records the outcome in the checkpoint and density map"""
+        self.stored = []
+        self.process_tile(tile, results, sub_tiles_results)
+        with self.metrics.time("save"):
+            self.checkpoint.record_tile(tile, self.new_tiles, self.stored)
+
+        if self.density:
+            for searched_tile, searched_results in [(tile, results)] + sub_tiles_results:
+                self.density.record(searched_tile, len(searched_results))
+
+
+    def search_tile(self, tile):
+        """Runs in a worker thread. Fetches the results for a tile, and the results of its
+        four subtiles if the tile returned zero results, so the zero can be verified in
+        process_tile without blocking the main thread."""
 
+        results = self.get_results(tile)
+        sub_tiles_results = []
+        if len(results) == 0:
+            sub_tiles_results = self.get_subtile_results(tile)
+        return results, sub_tiles_results
 
-    def process_tile(self, tile):
-        """Fetches data from the API for the tile, uses the hardcoded cap to determine
-        whether search grid should be split further (> cap = split). Handles API issues
-        when response contains zero results by checking subtiles in this case."""
 
-        # Get results for tile
-        results = self.get_results(tile)
-        time.sleep(MapsScraper.sleep_duration)
+    def process_tile(self, tile, results, sub_tiles_results):
+        """Uses the hardcoded cap to determine whether search grid should be split further
+        (> cap = split). Handles API issues when response contains zero results by checking
+        the results of the subtiles in this case, reusing their responses."""
 
         # If more results than cap, split search grid
         if len(results) >= MapsScraper.result_cap:
+            self.capped_ids.add(tile.tile_id)
             self.new_tiles = self.split_tile(tile)
             self.tiles.extend(self.new_tiles)
+            self.metrics.record_decision("split", tile)
             
-        # If 0 results, split tile into 4 subtiles and ensure they sum to 0.
+        # If 0 results, check the 4 subtiles sum to 0. If they don't, store or split subtiles
+        # using the results already fetched, only subtiles that also returned 0 are queued again.
         elif len(results) == 0:
-            sub_tiles_results, sub_tiles = self.get_subtile_results(tile)
-            if len(sub_tiles_results) != 0:
-                self.new_tiles = sub_tiles
-                self.tiles.extend(sub_tiles)
+            self.new_tiles = []
+            if any(sub_tile_results for _, sub_tile_results in sub_tiles_results):
+                for sub_tile, sub_tile_results in sub_tiles_results:
+                    if len(sub_tile_results) >= MapsScraper.result_cap:
+                        self.capped_ids.add(sub_tile.tile_id)
+                        self.new_tiles.extend(self.split_tile(sub_tile))
+                        self.requests_saved += 1
+                    elif len(sub_tile_results) > 0:
+                        self.store_results(sub_tile, sub_tile_results)
+                        self.requests_saved += 1
+                    else:
+                        self.new_tiles.append(sub_tile)
+                self.tiles.extend(self.new_tiles)
+                self.metrics.record_decision("zero_verified", tile)
             else:
-                self.new_tiles = []
+                self.metrics.record_decision("empty", tile)
 
         # If num results lower than cap, but not zero, store the results
         elif len(results) <= MapsScraper.result_cap:
             self.new_tiles = []
-            self.all_results.extend(results)
+            self.store_results(tile, results)
+            self.metrics.record_decision("stored", tile)
+
+
+    def dedupe(self, results):
+        """Returns the results whose id has not been seen before, marking their ids as seen"""
+        unique = []
+        for result in results:
+            if result.get("id") not in self.seen_ids:
+                self.seen_ids.add(result.get("id"))
+                unique.append(result)
+        return unique
+
+
+    def store_results(self, tile, results):
+        """Stores the new results of a tile, counting duplicates per tile to show where tiles overlap.
+        tile is None for results restored from a checkpoint."""
+        unique = self.dedupe(results)
+        if tile and len(unique) < len(results):
+            self.duplicates[(tile.tile_set, tile.tile_id)] += len(results) - len(unique)
+
+        self.stored.extend(unique)
+        self.n_results += len(unique)
+        if self.writer:
+            with self.metrics.time("save"):
+                self.writer.write(unique)
+        else:
+            self.all_results.extend(unique)
 
 
     def get_subtile_results(self, tile):
-        """Returns a list of results for the four subtiles of a tile. 
+        """Returns a list of (subtile, results) pairs for the four subtiles of a tile.
         Used to determine whether 0 results are actually 0."""
 
-        sub_tiles = self.split_tile(tile)
         sub_tiles_results = []
-        for sub_tile in sub_tiles:
-            sub_tile_results = self.get_results(sub_tile)
-            sub_tiles_results.extend(sub_tile_results)
-        return sub_tiles_results, sub_tiles
+        for sub_tile in self.split_tile(tile):
+            sub_tiles_results.append((sub_tile, self.get_results(sub_tile)))
+        return sub_tiles_results
 
 
     def get_results(self, tile):
         """Given a tile ID, makes a request and returns a list of results. 
-        Called in the process_tile function."""
-
-        self.params["tileId"] = tile["tile_id"]
-        response = self.get_response()
+        Called from worker threads, so the request params are copied per tile.
+        Responses are served from the response cache when one is enabled."""
+
+        params = dict(self.params, tileId=tile.tile_id)
+        response = None
+        if self.cache:
+            with self.metrics.time("cache"):
+                response = self.cache.get(params)
+        if response is None:
+            self.metrics.record_fetch()
+            response = self.get_response(params)
+            if self.cache:
+                with self.metrics.time("cache"):
+                    self.cache.set(params, response)
 
         # Handle case where no results in response
         if not "results" in response: 
             return []
         
         # Flatten list of lists and subdictionaries containing geodata
-        results = flatten_structure(response["results"])
-        for result in results:
-            result["category_id"] = self.category_id
-            geo_data = result.pop("geo", {})
-            result.update(geo_data)
-            result.update(tile)
+        with self.metrics.time("parse"):
+            results = flatten_structure(response["results"])
+            tile_dict = tile.to_dict()
+            for result in results:
+                result["category_id"] = self.category_id
+                geo_data = result.pop("geo", {})
+                result.update(geo_data)
+                result.update(tile_dict)
         
         return results
     
 
     @retry(n_attempts=3, wait=10, exponential_backoff=True)
-    def get_response(self):
-        """Error handling for the request, allows up to 3 retries before raising"""
+    def get_response(self, params):
+        """Error handling for the request, allows up to 3 retries before raising.
+        Every attempt waits for the shared rate limiter and reports its status code back to it,
+        and is recorded in the metrics."""
         try:
-            response = requests.get(
-                MapsScraper.url,
-                params=self.params,
-                headers=MapsScraper.headers,
-            )
+            with self.metrics.time("rate_limit"):
+                self.rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(
+                    self.url,
+                    params=params,
+                    headers=MapsScraper.headers,
+                )
+            except RequestException:
+                self.metrics.record_request(time.perf_counter() - start, "error", 0)
+                raise
+            self.metrics.record_request(time.perf_counter() - start, response.status_code, len(response.content))
+            self.rate_limiter.feedback(response.status_code, response.headers.get("Retry-After"))
             response.raise_for_status()
 
-            res_json = response.json()
+            with self.metrics.time("parse"):
+                res_json = response.json()
         except RequestException as e:
-            print(f"Request failed for {self.params['tileId']}: {e}")
+            print(f"Request failed for {params['tileId']}: {e}")
             raise
 
         return res_json
     
 
-    def split_tiles_until_length(self, tiles, min_length=5):
-        """Receives a tileID string, splits the tile into 4 subtiles using the split_tile method until
-        all subtiles are at least min_length long. Returns the subtiles"""
+    @staticmethod
+    def split_tiles_until_length(tiles, min_length=5, lazy=False):
+        """Receives a tileID string or list of them, and returns every subtile min_length digits
+        long under each tile, enumerated directly in one pass. Tiles at least min_length long are
+        returned unchanged. With lazy set, returns a generator instead of a list."""
 
         # Ensure tiles is a list
         if isinstance(tiles, str):
-            new_tiles = [tiles]
-        else:
-            new_tiles = tiles
+            tiles = [tiles]
 
-        # Sort the tiles by length
-        new_tiles = sorted(new_tiles, key=len)
-
-        while len(new_tiles[0]) < min_length:
-            new_tiles = self.split_tile(new_tiles[0]) + new_tiles[1:]
-            new_tiles = sorted(new_tiles, key=len)
-            
-        return new_tiles
+        new_tiles = (tile + "".join(digits)
+                     for tile in tiles
+                     for digits in product("0123", repeat=max(0, min_length - len(tile))))
+        return new_tiles if lazy else list(new_tiles)
 
 
 
-    def split_tile(self, tile, keys={}):
-        """Splits a tile into its four subtiles
+    @staticmethod
+    def split_tile(tile):
+        """Splits a tile ID string or Tile record into its four subtiles of the same type
         Tile ids contain integers from 0 to 3. Each grid contains 4 subgrids.
         E.g. id=13130 contains the subgrids 131300, 131301, 131302, 131303"""
 
-        # Ensure tile is a dictionary
-        original_type = type(tile)
-        if original_type == str:
-            tile = {"tile_id": tile}
+        if isinstance(tile, Tile):
+            return tile.children()
+        return [tile + str(i) for i in range(4)]
 
-        new_tiles = []
-        for i in range(4):
-            new_tile = tile.copy()
-            new_tile["tile_id"] = tile["tile_id"]+str(i)
 
-            # Give custom keys to subtiles
-            for key, val in keys.items():
-                new_tile[key] = val
-            
-            new_tiles.append(new_tile)
-        
-        # Return as string if original tile was a string
-        if original_type == str:
-            return [tile["tile_id"] for tile in new_tiles]
-        
-        return new_tiles
+class EventLog():
+    """Compact JSON lines log of the tiles searched during a run, replayed offline by data/resources/replay.py.
+    A header ["h", initial tile IDs, category IDs] is followed by ["s", t, category, tile ID] when a tile
+    starts and ["f", t, category, tile ID, results, stored, new tile suffixes] when it is finished."""
+
+    def __init__(self, filepath, initial_tiles, category_ids):
+        """Starts a new log at filepath"""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        self.file = open(filepath, "w")
+        self.start = time.time()
+        self.write(["h", [tile.tile_id for tile in initial_tiles], list(category_ids)])
+
+
+    def write(self, event):
+        """Writes one event line"""
+        self.file.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+
+    def started(self, category_i, tile):
+        """Logs the start of a tile's search"""
+        self.write(["s", round(time.time() - self.start, 3), category_i, tile.tile_id])
+
+
+    def finished(self, category_i, tile, n_results, n_stored, new_tiles):
+        """Logs a finished tile, the number of results returned and stored, and the subtiles it queued"""
+        new_tiles = [new_tile.tile_id[len(tile.tile_id):] for new_tile in new_tiles]
+        self.write(["f", round(time.time() - self.start, 3), category_i, tile.tile_id, n_results, n_stored, new_tiles])
+
+
+    @staticmethod
+    def read(filepath):
+        """Yields the events of a log as lists, starting with the header"""
+        with open(filepath, "r") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+    def close(self):
+        """Closes the log"""
+        self.file.close()
+
+
+class Scheduler():
+    """Runs the searches of one or more MapsScrapers, one per category, in a single worker pool.
+    Later categories backfill idle workers, so the pool never drains between categories."""
+
+    def __init__(self, scrapers, workers, visualiser_settings, event_log=None):
+        """Initialises the visualisation if needed, all scrapers share the first one's tiles and progress bar.
+        With event_log given as a filepath, every tile searched is logged there by an EventLog."""
+        self.scrapers = scrapers
+        self.workers = workers
+        self.visualiser_settings = visualiser_settings
+        self.prog_bar = scrapers[0].prog_bar if scrapers else None
+        self.metrics = scrapers[0].metrics if scrapers else None
+        self.in_flight = {}
+        self.completed = 0
+
+        self.event_log = None
+        if event_log and scrapers:
+            self.event_log = EventLog(event_log, initial_tiles=scrapers[0].initial_tiles,
+                                      category_ids=[scraper.category_id for scraper in scrapers])
+
+        self.visualiser = None
+        if self.visualiser_settings["display"] and scrapers:
+            self.visualiser = Visualiser(initial_tiles=[tile.to_dict() for tile in scrapers[0].initial_tiles],
+                                         settings=self.visualiser_settings)
+
+
+    def run(self):
+        """Keeps up to self.workers requests in flight, processing tiles in the order their requests
+        complete. Each scraper is finished as soon as its frontier has drained."""
+
+        if not self.scrapers:
+            return
+
+        start = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                while self.in_flight or any(scraper.tiles for scraper in self.scrapers):
+                    self.submit(executor)
+                    if not self.in_flight:
+                        continue
+
+                    # Process tiles from the completion stream
+                    done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        scraper, tile = self.in_flight.pop(future)
+                        scraper.in_flight -= 1
+                        results, sub_tiles_results = future.result()
+                        scraper.complete_tile(tile, results, sub_tiles_results)
+                        self.update(scraper, tile, len(results))
+                        if not scraper.tiles and not scraper.in_flight:
+                            scraper.finish()
+        finally:
+            for scraper in self.scrapers:
+                scraper.checkpoint.flush()
+            if self.visualiser:
+                self.visualiser.close()
+            if self.event_log:
+                self.event_log.close()
+            self.metrics.export(force=True)
+
+        # Complete, including categories resumed from a finished checkpoint
+        for scraper in self.scrapers:
+            scraper.finish()
+
+        stats = self.scrapers[0].session.stats()
+        self.scrapers[0].log(f"Scraper finished in {round(time.time()-start)}s, "
+                             f"{stats['connections_reused']} of {stats['requests']} requests reused a connection")
+
+
+    def submit(self, executor):
+        """Fills the pool from the frontier of the earliest category with pending tiles"""
+        for scraper in self.scrapers:
+            while scraper.tiles and len(self.in_flight) < self.workers:
+                tile = scraper.tiles.popleft()
+                if scraper.skip_dense_tile(tile):
+                    self.update(scraper, tile)
+                    continue
+                scraper.in_flight += 1
+                self.in_flight[executor.submit(scraper.search_tile, tile)] = (scraper, tile)
+                if self.event_log:
+                    self.event_log.started(scraper.category_id_i, tile)
+
+
+    def update(self, scraper, tile, n_results=None):
+        """Updates the progress bar, visualisation and event log with a completed tile and the subtiles
+        it created, and exports the metrics if due. n_results is the number of results returned, None
+        for tiles skipped as dense."""
+        self.prog_bar.update(1)
+        status = {
+            "Category ID": f"{scraper.category_id_i}: {scraper.category_id}",
+            "Tiles Completed": self.completed,
+            "Tiles Remaining": sum(len(scraper.tiles) for scraper in self.scrapers) + len(self.in_flight),
+            "Locations Found": sum(scraper.n_results for scraper in self.scrapers),
+            "Request Rate": f"{scraper.rate_limiter.rate:.1f}/s",
+            "Current Parent Tile": tile.tile_parent_id,
+            "Current Search Tile": tile.tile_id,
+            }
+        self.prog_bar.set_postfix(status)
+        self.completed += 1
+
+        if self.event_log:
+            self.event_log.finished(scraper.category_id_i, tile, n_results, len(scraper.stored) if n_results is not None else 0, scraper.new_tiles)
+        if self.visualiser:
+            with self.metrics.time("visualiser"):
+                self.visualiser.publish(tile.tile_id, [new_tile.tile_id for new_tile in scraper.new_tiles], status)
+        self.metrics.export()
+
+
+class Visualiser():
+    """Runs the TilePlot in its own process so that drawing never slows the scraper down.
+    The scheduler publishes tile events to a queue without waiting, the render process applies
+    every queued event and then draws a single frame at a fixed rate, so bursts are coalesced."""
+
+    fps = 10
+
+    def __init__(self, initial_tiles, settings):
+        """Starts the render process. settings are the visualiser settings, with an optional "fps"."""
+        context = multiprocessing.get_context("spawn")
+        self.events = context.Queue()
+        self.process = context.Process(target=Visualiser.render, args=(self.events, initial_tiles, settings), daemon=True)
+        self.process.start()
+
+
+    def publish(self, tile_id, new_tile_ids, status):
+        """Queues a searched tile, the subtiles it created and the current status.
+        Events are dropped once the plot window has been closed."""
+        if self.process.is_alive():
+            self.events.put((tile_id, new_tile_ids, status))
+
+
+    def close(self, timeout=10):
+        """Lets the render process draw the remaining events, then waits up to timeout seconds
+        for it to exit. A render process that is still behind is terminated and its backlog dropped."""
+        if self.process.is_alive():
+            self.events.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.events.cancel_join_thread()
+        self.events.close()
+
+
+    @staticmethod
+    def render(events, initial_tiles, settings):
+        """Render process loop, runs until the scraper finishes or the plot window is closed"""
+        tile_plot = TilePlot(initial_tiles=initial_tiles, settings=settings)
+        interval = 1 / settings.get("fps", Visualiser.fps)
+
+        running = True
+        while running and plt.fignum_exists(tile_plot.fig.number):
+            frame_end = time.time() + interval
+
+            # Apply every queued event, however many arrived since the last frame
+            status = None
+            while True:
+                try:
+                    event = events.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    running = False
+                    break
+                tile_id, new_tile_ids, status = event
+                tile_plot.update({"tile_id": tile_id}, [{"tile_id": new_tile_id} for new_tile_id in new_tile_ids], draw=False)
+
+            # Draw one frame for all applied events, then wait for the next
+            if status:
+                tile_plot.update_labels(status, draw=False)
+            tile_plot.draw()
+            time.sleep(max(frame_end - time.time(), 0))
+
+        plt.close("all")
 
 
 class TilePlot():
@@ -350,18 +1642,21 @@ class TilePlot():
     tqdm bar could not handle this. Also useful for debugging recursive search."""
 
     sleep_duration = 0.1
+    max_redraws = 200
 
     def __init__(self, initial_tiles, settings):
         """Creates the plot, provides the initial data and state of the plot.
-        Plot highlights the current tile, past tiles, and remaining tiles."""
+        Plot highlights the current tile, past tiles, and remaining tiles.
+        Map imagery is fetched through the plot's own pooled HTTPSession."""
 
-        # Initialise settings
+        # Initialise settings, the plot runs in its own process so it can't share the scraper's session
         self.settings = settings
+        self.session = HTTPSession()
         self.opacity = 0.5 if settings["overlay_map"] else 1
 
         # Colours for current tile plot
-        self.cur_edgecolor = to_rgba(Utils.colors["red"], alpha=1)
-        self.cur_facecolor = to_rgba(Utils.colors["dark"], alpha=self.opacity)
+        self.cur_edgecolor = mcolors.to_rgba(Utils.colors["red"], alpha=1)
+        self.cur_facecolor = mcolors.to_rgba(Utils.colors["dark"], alpha=self.opacity)
 
         # Initialise plot
         sns.set_theme(style="whitegrid")
@@ -375,35 +1670,45 @@ class TilePlot():
         self.ax.set_ylabel("Latitude", **self.label_font)
         self.ax.set_aspect("equal", adjustable="box")
 
+        # Changing artists are animated and blitted over a static background where the backend allows
+        self.blit = settings.get("blit", True) and self.fig.canvas.supports_blit
+        self.background = None
+        self.dirty_tiles = {}
+        self.labels_dirty = False
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+
         # Plot background tiles
         self.initial_tile_patches = []
+        self.id_labels = {}
         for xy in self.initial_tiles_xy:
-            rectangle = Rectangle((xy["x1"], xy["y1"]), xy["x2"] - xy["x1"], xy["y2"] - xy["y1"], edgecolor=Utils.colors["light"], facecolor=Utils.colors["dark"], zorder=0, alpha=1)
+            rectangle = mpatches.Rectangle((xy["x1"], xy["y1"]), xy["x2"] - xy["x1"], xy["y2"] - xy["y1"], edgecolor=Utils.colors["light"], facecolor=Utils.colors["dark"], zorder=0, alpha=1)
             new_patch = self.ax.add_patch(rectangle)
 
-            # Add tile_id as text centered on the rectangle
+            # Add tile_id as text centered on the rectangle, clipped to it
             if self.settings["overlay_ids"]:
                 center_x = xy["x1"] + (xy["x2"] - xy["x1"]) / 2
                 center_y = xy["y1"] + (xy["y2"] - xy["y1"]) / 2
-                self.ax.text(center_x, center_y, xy["tile_id"], ha="center", va="center", fontsize=8, color="red", zorder=10)
+                label = self.ax.text(center_x, center_y, xy["tile_id"], ha="center", va="center", fontsize=8, color="red", zorder=10, clip_on=True, animated=self.blit)
+                label.set_clip_box(mtransforms.TransformedBbox(mtransforms.Bbox.from_extents(xy["x1"], xy["y1"], xy["x2"], xy["y2"]), self.ax.transData))
+                self.id_labels[xy["tile_id"]] = label
 
-            # Display map
-            if self.settings["overlay_map"]:
-                self.fetch_and_display_image(xy["tile_id"], rectangle)
             self.initial_tile_patches.append(new_patch)
 
-        self.current_tile_patch = None
+        # Display map
+        if self.settings["overlay_map"]:
+            self.display_map(self.initial_tiles_xy)
+
+        # Current tile is a single patch, moved to each searched tile
+        self.current_tile_id = None
+        self.current_tile_patch = self.ax.add_patch(mpatches.Rectangle((0, 0), 0, 0, edgecolor=self.cur_edgecolor, facecolor=self.cur_facecolor, zorder=2, visible=False, animated=self.blit))
 
-        # Plot all initial subtiles
-        self.subtile_patches = []
+        # Plot all initial subtiles, indexed by tile ID
+        self.subtile_patches = {}
         for xy in self.initial_tiles_xy:
-            rectangle = Rectangle((xy["x1"], xy["y1"]), xy["x2"] - xy["x1"], xy["y2"] - xy["y1"], edgecolor=Utils.colors["light"], facecolor=Utils.colors["dark"], zorder=1, alpha=self.opacity)
-            new_patch = self.ax.add_patch(rectangle)
-            new_patch.tile_xy = xy
-            self.subtile_patches.append(new_patch)
+            self.add_subtile(xy)
         
         # Initialise status labels
-        self.status_labels = []
+        self.status_labels = {}
 
         self.format()
         plt.draw()
@@ -448,105 +1753,515 @@ class TilePlot():
         self.ax.tick_params(axis="y", colors=Utils.colors["light"])
 
 
-    def update(self, current_tile, new_tiles):
-        """Plot is updated for each tile searched, sleeping for 0.1s between updates.
-        Current tile and new_tiles change with each update. Current tile is highlighted
-        in red, new_tiles (from a tile split) are added to the remaining tiles."""
+    def update(self, current_tile, new_tiles, draw=True):
+        """Plot is updated for each tile searched. Current tile is highlighted in red, new_tiles (from a tile split)
+        are added to the remaining tiles and the changed tiles are marked for redrawing.
+        With draw False the changes are not shown until the next draw, for batching updates."""
 
         # Convert tiles to plottable format
-        self.tile_xy = TilePlot.tiles_to_xy([current_tile], first=True)
-        self.new_tiles_xy = TilePlot.tiles_to_xy(new_tiles)
-
-        # Remove previous tile patch
-        if self.current_tile_patch:
-            self.current_tile_patch.remove()
-
-        # Add new current tile
-        current_tile_rect = Rectangle((self.tile_xy["x1"], self.tile_xy["y1"]),
-                              self.tile_xy["x2"] - self.tile_xy["x1"],
-                              self.tile_xy["y2"] - self.tile_xy["y1"],
-                              edgecolor=self.cur_edgecolor, facecolor=self.cur_facecolor, zorder=2)
-        self.current_tile_patch = self.ax.add_patch(current_tile_rect)
-        self.current_tile_patch.tile_xy = self.tile_xy
-
-        # Remove subtile under current tile
-        match = None
-        for subtile_patch in self.subtile_patches:
-            if getattr(subtile_patch, "tile_xy", None) == self.current_tile_patch.tile_xy:
-                match = subtile_patch
-        if match:
-            match.remove()
-            self.subtile_patches.remove(match)
-
-        # Add new subtiles
-        for xy in self.new_tiles_xy:
-            rectangle = Rectangle((xy["x1"], xy["y1"]), xy["x2"] - xy["x1"], xy["y2"] - xy["y1"], edgecolor=Utils.colors["light"], facecolor=Utils.colors["dark"], zorder=1, alpha=self.opacity)
-            new_patch = self.ax.add_patch(rectangle)
-            new_patch.tile_xy = xy
-            self.subtile_patches.append(new_patch)
-        
-        plt.pause(TilePlot.sleep_duration)
+        tile_xy = TilePlot.tiles_to_xy([current_tile], first=True)
+        previous_tile_id = self.current_tile_id
+        self.current_tile_id = tile_xy["tile_id"]
+
+        # Replace the subtile under the current tile with its new subtiles
+        patch = self.subtile_patches.pop(self.current_tile_id, None)
+        if patch:
+            patch.remove()
+        for xy in TilePlot.tiles_to_xy(new_tiles):
+            self.add_subtile(xy)
 
+        # Move the current tile highlight
+        self.current_tile_patch.set_bounds(tile_xy["x1"], tile_xy["y1"], tile_xy["x2"] - tile_xy["x1"], tile_xy["y2"] - tile_xy["y1"])
+        self.current_tile_patch.set_visible(True)
 
-    def update_labels(self, status):
+        # Tiles are redrawn in the order they were first marked, so parents are drawn before their subtiles
+        if self.blit:
+            if previous_tile_id:
+                self.dirty_tiles.setdefault(previous_tile_id, None)
+            self.dirty_tiles.setdefault(self.current_tile_id, None)
+
+        if draw:
+            self.draw()
+
+
+    def update_labels(self, status, draw=True):
         """Receives a dictionary of status updates and updates the labels to the right of the plot."""
-        # Clear any existing labels
-        for label in self.status_labels:
-            label.remove()
-        self.status_labels.clear()
-        
-        # Add new labels to the right of the plot
-        self.status_labels = []
+
+        # Add any new labels to the right of the plot, then update the text of all labels
         x_pos = 1.05
-        y_pos = 0.85
+        y_pos = 0.85 - 0.05 * len(self.status_labels)
+        for key in status:
+            if key not in self.status_labels:
+                self.status_labels[key] = self.fig.text(x_pos, y_pos, "", transform=self.ax.transAxes, zorder=1, animated=self.blit, **self.label_font)
+                y_pos -= 0.05
         for key, value in status.items():
-            label = self.fig.text(x_pos, y_pos, f"{key}: {value}", transform=self.ax.transAxes, zorder=1, **self.label_font)
-            self.status_labels.append(label)
-            y_pos -= 0.05 
-        
-        plt.draw()
+            self.status_labels[key].set_text(f"{key}: {value}")
+
+        self.labels_dirty = self.blit
+        if draw:
+            self.draw()
+
+
+    def add_subtile(self, xy):
+        """Adds a patch for a remaining tile"""
+        rectangle = mpatches.Rectangle((xy["x1"], xy["y1"]), xy["x2"] - xy["x1"], xy["y2"] - xy["y1"], edgecolor=Utils.colors["light"], facecolor=Utils.colors["dark"], zorder=1, alpha=self.opacity, animated=self.blit)
+        self.subtile_patches[xy["tile_id"]] = self.ax.add_patch(rectangle)
+
+
+    def tile_extents(self, tile_ids, pad=0):
+        """Returns the extents of tiles in display coordinates as an array of (x0, y0, x1, y1) rows,
+        rounded outwards to whole pixels after padding by pad pixels"""
+        if not tile_ids:
+            return np.empty((0, 4))
+        x1, y1, x2, y2 = Quadkey.to_bounds(list(tile_ids), crs="normalised")
+        corner1 = self.ax.transData.transform(np.column_stack([x1, y1]))
+        corner2 = self.ax.transData.transform(np.column_stack([x2, y2]))
+        return np.column_stack([
+            np.floor(np.minimum(corner1, corner2) - pad),
+            np.ceil(np.maximum(corner1, corner2) + pad),
+        ])
+
+
+    def redraw_area(self, extent, patch_extents, label_extents):
+        """Restores the background within an extent in display coordinates and redraws every animated
+        artist overlapping it in z-order, clipped to the extent so that no pixel is drawn twice"""
+        bbox = mtransforms.Bbox.from_extents(*extent)
+        self.restore_background(bbox)
+
+        def overlapping(extents):
+            return np.flatnonzero((extents[:, 0] <= extent[2]) & (extents[:, 2] >= extent[0]) &
+                                  (extents[:, 1] <= extent[3]) & (extents[:, 3] >= extent[1]))
+
+        for i in overlapping(patch_extents[0]):
+            self.draw_clipped(self.subtile_patches[patch_extents[1][i]], bbox)
+        if self.current_tile_patch.get_visible():
+            self.draw_clipped(self.current_tile_patch, bbox)
+        for i in overlapping(label_extents[0]):
+            self.draw_clipped(self.id_labels[label_extents[1][i]], bbox)
+
+
+    def draw_clipped(self, artist, bbox):
+        """Draws an animated artist only within a bounding box in display coordinates, and within
+        its own clip box if it has one"""
+        clip_box, clip_on = artist.get_clip_box(), artist.get_clip_on()
+        if clip_on and clip_box is not None:
+            bbox = mtransforms.Bbox.intersection(clip_box, bbox)
+            if bbox is None:
+                return
+        artist.set_clip_box(bbox)
+        artist.set_clip_on(True)
+        self.fig.draw_artist(artist)
+        artist.set_clip_box(clip_box)
+        artist.set_clip_on(clip_on)
+
+
+    def restore_background(self, bbox):
+        """Restores part of the saved background, given as a bounding box in display coordinates"""
+        height = self.fig.bbox.height
+        x1, x2 = max(bbox.x0, 0), min(bbox.x1, self.fig.bbox.width)
+        y1, y2 = max(bbox.y0, 0), min(bbox.y1, height)
+
+        # Canvas buffers are indexed from the top left, the background is saved from the origin.
+        # Agg includes the last row and column of the region, so they are excluded here
+        self.fig.canvas.restore_region(self.background, bbox=(x1, height - y2, x2 - 1, height - y1 - 1), xy=(0, 0))
+
+
+    def on_draw(self, event):
+        """Keeps the static background after each full redraw, e.g. on resize, and draws the animated artists over it"""
+        if not self.blit:
+            return
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for patch in self.subtile_patches.values():
+            self.ax.draw_artist(patch)
+        if self.current_tile_patch.get_visible():
+            self.ax.draw_artist(self.current_tile_patch)
+        for label in self.id_labels.values():
+            self.ax.draw_artist(label)
+        for label in self.status_labels.values():
+            self.fig.draw_artist(label)
+
+
+    def draw(self):
+        """Shows all changes made since the last draw. With blitting, the marked tiles and labels are
+        redrawn over the background and blitted once, or the figure is redrawn if too many changed."""
+        if not self.blit:
+            self.fig.canvas.draw_idle()
+        elif self.background is None or len(self.dirty_tiles) > TilePlot.max_redraws:
+            self.fig.canvas.draw()
+            self.fig.canvas.blit(self.fig.bbox)
+        else:
+            # Tile edges are centred on the tile bounds, so areas are padded by half the widest edge
+            pad = np.ceil(max(self.current_tile_patch.get_linewidth(), plt.rcParams["patch.linewidth"]) * self.fig.dpi / 144) + 1
+            patch_ids, label_ids = list(self.subtile_patches), list(self.id_labels)
+            patch_extents = (self.tile_extents(patch_ids, pad), patch_ids)
+            label_extents = (self.tile_extents(label_ids), label_ids)
+            for extent in self.tile_extents(self.dirty_tiles, pad):
+                self.redraw_area(extent, patch_extents, label_extents)
+
+            # Redraw the area right of the plot
+            if self.labels_dirty:
+                self.restore_background(mtransforms.Bbox.from_extents(self.ax.bbox.x1 + 1, 0, self.fig.bbox.x1, self.fig.bbox.y1))
+                for label in self.status_labels.values():
+                    self.fig.draw_artist(label)
+            self.fig.canvas.blit(self.fig.bbox)
+
+        self.dirty_tiles.clear()
+        self.labels_dirty = False
+        self.fig.canvas.flush_events()
 
     @staticmethod
     def tiles_to_xy(tiles, first=False):
         """Converts a tile ID into two pairs of x,y coordinates, from 0 to 1
         Allows tiles to be plotted on an axis from 0 to 1."""
 
-        tiles_xy = []
-        for tile in tiles:
-            tile_id = tile["tile_id"]
-
-            x1, y1 = 0, 0
-            x2, y2 = 1, 1
-            for digit in str(tile_id):
-                x_mid = (x2 + x1)/2
-                y_mid = (y2 + y1)/2
-                if digit in ["0", "1"]:
-                    y1 = y_mid
-                if digit in ["2", "3"]:
-                    y2 = y_mid
-                if digit in ["0", "2"]:
-                    x2 = x_mid
-                if digit in ["1", "3"]:
-                    x1 = x_mid
-            tiles_xy.append({"x1": x1, "x2": x2, "y1": y1, "y2": y2, "tile_id": tile_id})
+        tile_ids = [str(tile["tile_id"]) for tile in tiles]
+        if not tile_ids:
+            return []
+        x1, y1, x2, y2 = (bound.tolist() for bound in Quadkey.to_bounds(tile_ids, crs="normalised"))
+        tiles_xy = [{"x1": x1[i], "x2": x2[i], "y1": y1[i], "y2": y2[i], "tile_id": tile_id}
+                    for i, tile_id in enumerate(tile_ids)]
 
         if first:
             return tiles_xy[0]
         return tiles_xy
 
 
-    def fetch_and_display_image(self, tile_id, patch):
-        """Retrives the image for a tile_id from bing maps, plots it on a given patch."""
+    def display_map(self, tiles_xy):
+        """Plots map imagery over the given tiles as a single mosaic image, at most map_resolution
+        pixels across (default 2048). Imagery is fetched no more detailed than the mosaic needs, so
+        small tiles share their ancestor's image, and is cached on disk between runs."""
+
+        # Mosaic bounds and pixels per unit of the 0 to 1 plot
+        tiles_df = pd.DataFrame(tiles_xy)
+        x_min, x_max = tiles_df["x1"].min(), tiles_df["x2"].max()
+        y_min, y_max = tiles_df["y1"].min(), tiles_df["y2"].max()
+        scale = self.settings.get("map_resolution", 2048) / max(x_max - x_min, y_max - y_min)
+        level = max(1, int(np.ceil(np.log2(scale / 256))))
+
+        image_cache = ImageCache(self.settings.get("image_cache") or os.path.join(App.app_dir, "output", "image_cache.sqlite"),
+                                 session=self.session)
+        images = image_cache.fetch(xy["tile_id"][:level] for xy in tiles_xy)
+        image_cache.close()
+
+        # Paste the part of each fetched image covering each tile
+        mosaic = Image.new("RGBA", (max(round((x_max - x_min) * scale), 1), max(round((y_max - y_min) * scale), 1)))
+        for xy in tiles_xy:
+            source_id = xy["tile_id"][:level]
+            if source_id not in images:
+                continue
+            source = TilePlot.tiles_to_xy([{"tile_id": source_id}], first=True)
+            image = images[source_id].convert("RGBA")
+            source_scale = image.width / (source["x2"] - source["x1"])
+            crop_left, crop_top = int((xy["x1"] - source["x1"]) * source_scale), int((source["y2"] - xy["y2"]) * source_scale)
+            crop = (crop_left, crop_top, max(round((xy["x2"] - source["x1"]) * source_scale), crop_left + 1),
+                    max(round((source["y2"] - xy["y1"]) * source_scale), crop_top + 1))
+            left, top = round((xy["x1"] - x_min) * scale), round((y_max - xy["y2"]) * scale)
+            size = (max(round((xy["x2"] - x_min) * scale) - left, 1), max(round((y_max - xy["y1"]) * scale) - top, 1))
+            mosaic.paste(image.crop(crop).resize(size), (left, top))
+
+        self.ax.imshow(mosaic, aspect="auto", extent=(x_min, x_max, y_min, y_max), zorder=0, alpha=1)
+
+
+class Profiler():
+    """Profiles a stage of the App into the project folder, by sampling the stacks of every thread
+    ("sampling", written as .txt and .folded) or with cProfile ("cprofile", written as .txt and .prof).
+    The summary splits wall time into categories, e.g. network wait, JSON parsing and pandas."""
+
+    # Categories are matched against the top-level module of each frame, or against the qualified
+    # name of functions in this module, innermost frame first
+    categories = [
+        ("rate_limit", ["RateLimiter.acquire"]),
+        ("cache", ["ResponseCache.", "ImageCache.", "DensityMap."]),
+        ("save", ["Checkpoint.", "ResultWriter.", "EventLog.", "Metrics.export"]),
+        ("network", ["requests", "urllib3", "http", "socket", "ssl", "selectors", "_socket", "_ssl"]),
+        ("json", ["json", "_json"]),
+        ("pandas", ["pandas"]),
+        ("numpy", ["numpy"]),
+        ("plotting", ["matplotlib", "seaborn", "PIL"]),
+        ("sqlite", ["sqlite3", "_sqlite3"]),
+    ]
+    idle_modules = ["threading", "queue", "concurrent", "_thread"]
+
+    def __init__(self, filepath, mode="sampling", interval=0.01, top=25):
+        """filepath is the path of the output files without extension, interval the sampling
+        interval in seconds and top the number of functions listed in the summary"""
+        if mode not in ("sampling", "cprofile"):
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.filepath = filepath
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+        self.samples = Counter()
+        self.stop_event = threading.Event()
+
+
+    @staticmethod
+    def classify(frames):
+        """Returns the category of a stack given as (module, qualified name) pairs, innermost first.
+        Stacks matching no category are idle if waiting in threading or queue code, otherwise python."""
+        for module, name in frames:
+            top_module = module.split(".")[0]
+            for category, names in Profiler.categories:
+                if top_module in names or (module == __name__ and any(name.startswith(n) for n in names)):
+                    return category
+        if frames and frames[0][0].split(".")[0] in Profiler.idle_modules:
+            return "idle"
+        return "python"
+
+
+    def sample(self):
+        """Runs in the sampling thread, recording the stack of every other thread until stopped.
+        Each sample is weighted by the time since the previous one."""
+        own_id = threading.get_ident()
+        main_id = threading.main_thread().ident
+        last = time.perf_counter()
+        while not self.stop_event.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_code, frame.f_globals.get("__name__", "")))
+                    frame = frame.f_back
+                self.samples[(thread_id == main_id, tuple(stack))] += now - last
+            last = now
+
+
+    def __enter__(self):
+        """Starts profiling"""
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        self.start = time.perf_counter()
+        if self.mode == "sampling":
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        else:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+
+    def __exit__(self, *exc):
+        """Stops profiling and writes the results"""
+        if self.mode == "sampling":
+            self.stop_event.set()
+            self.thread.join()
+        else:
+            self.profile.disable()
+        wall_time = time.perf_counter() - self.start
+
+        lines = [f"Profile of {os.path.basename(self.filepath)}, {wall_time:.1f}s wall time, {self.mode} mode", ""]
+        lines += self.summarise_samples() if self.mode == "sampling" else self.summarise_cprofile()
+        with open(self.filepath + ".txt", "w") as file:
+            file.write("\n".join(lines) + "\n")
+        print(f"Profile saved to {self.filepath}.txt")
 
-        url = f"https://t.ssl.ak.dynamic.tiles.virtualearth.net/comp/ch/{tile_id}?mkt=en-GB&it=G,LC,BF,L,LA&shading=hill&jp=0&n=z&og=2390&cstl=s23&o=webp&ur=gb"
-        response = requests.get(url)
-        if response.status_code == 200:
-            image = Image.open(BytesIO(response.content))
-            
-            # Plot image on patch
-            x0, y0 = patch.get_xy()
-            width, height = patch.get_width(), patch.get_height()
-            self.ax.imshow(image, aspect="auto", extent=(x0, x0 + width, y0, y0 + height), zorder=0, alpha=1)
+
+    @staticmethod
+    def frame_name(code, module):
+        """Returns a readable name for a code object"""
+        return f"{module}:{getattr(code, 'co_qualname', code.co_name)}:{code.co_firstlineno}"
+
+
+    def summarise_samples(self):
+        """Returns the summary lines of a sampling profile and writes its collapsed stacks"""
+        by_category = {}
+        own, cumulative, folded = Counter(), Counter(), Counter()
+        for (is_main, stack), seconds in self.samples.items():
+            frames = [(module, getattr(code, "co_qualname", code.co_name)) for code, module in stack]
+            category = Profiler.classify(frames)
+            by_category.setdefault(category, [0, 0])[0 if is_main else 1] += seconds
+
+            names = [Profiler.frame_name(code, module) for code, module in stack]
+            if names:
+                own[names[0]] += seconds
+            for name in set(names):
+                cumulative[name] += seconds
+            folded[";".join(["main" if is_main else "worker"] + names[::-1])] += seconds
+
+        with open(self.filepath + ".folded", "w") as file:
+            file.write("".join(f"{stack} {round(seconds * 1000)}\n" for stack, seconds in folded.items()))
+
+        lines = ["Thread time by category (s), summed over the main thread and the worker threads",
+                 f"{'category':<12}{'main':>10}{'workers':>10}"]
+        for category, (main, workers) in sorted(by_category.items(), key=lambda item: -sum(item[1])):
+            lines.append(f"{category:<12}{main:>10.2f}{workers:>10.2f}")
+        lines += ["", "Top functions by own time (s)"]
+        lines += [f"{seconds:>10.2f}  {name}" for name, seconds in own.most_common(self.top)]
+        lines += ["", "Top functions by cumulative time (s)"]
+        lines += [f"{seconds:>10.2f}  {name}" for name, seconds in cumulative.most_common(self.top)]
+        return lines
+
+
+    def summarise_cprofile(self):
+        """Returns the summary lines of a cProfile run and dumps its stats"""
+        self.profile.dump_stats(self.filepath + ".prof")
+        stats = pstats.Stats(self.profile)
+
+        # Own time is attributed by the module path of each function, or the name of builtins
+        by_category = Counter()
+        for (filename, _, name), (_, _, own_time, _, _) in stats.stats.items():
+            if filename == "~":
+                parts = [part for part in name.replace("'", " ").replace(".", " ").split()]
+            else:
+                parts = list(os.path.normpath(filename).split(os.sep)) + [os.path.splitext(os.path.basename(filename))[0]]
+            category = Profiler.classify([(part, "") for part in parts if part])
+            if category == "python" and any(part in Profiler.idle_modules for part in parts):
+                category = "idle"
+            by_category[category] += own_time
+
+        lines = ["Own time by category (s), calling thread only"]
+        lines += [f"{category:<12}{seconds:>10.2f}" for category, seconds in by_category.most_common()]
+        output = StringIO()
+        stats.stream = output
+        stats.sort_stats("cumulative").print_stats(self.top)
+        return lines + ["", output.getvalue()]
+
+
+    @staticmethod
+    def stage(name):
+        """Decorator for App stages, adding a profile keyword argument that runs the stage under a
+        Profiler in that mode, "sampling" or "cprofile", writing to profile-<name>.* in the project folder"""
+        def decorator(method):
+            @functools.wraps(method)
+            def wrapper(app, *args, profile=None, **kwargs):
+                if not profile:
+                    return method(app, *args, **kwargs)
+                with app.profile(name, profile):
+                    return method(app, *args, **kwargs)
+            return wrapper
+        return decorator
+
+
+class ShardQueue():
+    """SQLite queue of the shards of a sharded run in the project folder, from which worker processes
+    claim shards. Shards whose worker stops heartbeating are claimed again, shards that fail
+    max_attempts times are left failed."""
+
+    max_attempts = 3
+
+    def __init__(self, filepath):
+        """Opens or creates the queue at filepath. SQLite locking is unreliable on network filesystems
+        in any journal mode, so the queue must be on a local disk shared by all of its workers."""
+        self.conn = sqlite3.connect(filepath, timeout=60, isolation_level=None)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS shards (
+            shard_id INTEGER PRIMARY KEY, prefixes TEXT, tiles TEXT, status TEXT, worker TEXT,
+            heartbeat REAL, started REAL, finished REAL, attempts INTEGER, error TEXT)""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+
+    @staticmethod
+    def partition(tiles, n_shards):
+        """Partitions a list of Tile records into at most n_shards compact lists of tile IDs of about equal
+        size, grouped by quadkey prefix. Tiles are only split, which costs requests, while there are fewer
+        tiles than shards. Returns a list of (prefixes, tile IDs) pairs."""
+        tiles = sorted({tile.tile_id: tile for tile in tiles}.items())
+        if not tiles:
+            return []
+
+        # Split the first of the shortest tiles into its subtiles until every shard can get a tile
+        while len(tiles) < n_shards:
+            split_i = min(range(len(tiles)), key=lambda i: tiles[i][1].level)
+            children = [(child.tile_id, child) for child in tiles[split_i][1].children()]
+            tiles = sorted(tiles[:split_i] + children + tiles[split_i + 1:])
+
+        # Group by the shortest prefix giving enough groups, none larger than half a shard
+        share = len(tiles) / n_shards
+        for length in range(1, max(len(tile_id) for tile_id, _ in tiles) + 1):
+            groups = {}
+            for tile_id, _ in tiles:
+                groups.setdefault(tile_id[:length], []).append(tile_id)
+            if len(groups) >= n_shards and max(len(group) for group in groups.values()) <= max(share / 2, 1):
+                break
+
+        shards = []
+        count = 0
+        for i, prefix in enumerate(sorted(groups)):
+            # Start the next shard once most of this group lies beyond the previous shards' share,
+            # or when each remaining group needs a shard of its own
+            size = len(groups[prefix])
+            if len(shards) < n_shards and (count + size / 2 >= len(shards) * share or len(groups) - i <= n_shards - len(shards)):
+                shards.append(([], []))
+            shards[-1][0].append(prefix)
+            shards[-1][1].extend(groups[prefix])
+            count += size
+        return shards
+
+
+    def plan(self, tiles, n_shards, settings):
+        """Partitions the tiles into shards, unless the queue was already planned with the same
+        settings, in which case the existing shards and their progress are kept"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = self.settings()
+            if stored is not None:
+                if stored != json.loads(json.dumps(settings)):
+                    raise ValueError("The project was sharded with different settings, "
+                                     "delete shards.sqlite in the project folder to start over")
+                self.conn.execute("COMMIT")
+                return
+
+            self.conn.executemany("INSERT INTO shards VALUES (?, ?, ?, 'pending', NULL, NULL, NULL, NULL, 0, NULL)",
+                                  [(shard_id, json.dumps(prefixes), json.dumps(tile_ids))
+                                   for shard_id, (prefixes, tile_ids) in enumerate(ShardQueue.partition(tiles, n_shards))])
+            self.conn.executemany("INSERT INTO settings VALUES (?, ?)",
+                                  [(key, json.dumps(val)) for key, val in settings.items()])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+    def settings(self):
+        """Returns the run's settings, or None if the queue has not been planned"""
+        rows = self.conn.execute("SELECT key, value FROM settings").fetchall()
+        return {key: json.loads(value) for key, value in rows} if rows else None
+
+
+    def claim(self, worker, stale_after=300):
+        """Claims a pending shard, or a running shard whose worker has not heartbeated for
+        stale_after seconds. Returns (shard_id, tile IDs), or None when no shard is left to claim."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        row = self.conn.execute("""SELECT shard_id, tiles FROM shards
+            WHERE (status = 'pending' OR (status = 'running' AND heartbeat < ?)) AND attempts < ?
+            ORDER BY attempts, shard_id LIMIT 1""", (now - stale_after, ShardQueue.max_attempts)).fetchone()
+        if row:
+            self.conn.execute("""UPDATE shards SET status = 'running', worker = ?, heartbeat = ?, started = ?,
+                attempts = attempts + 1 WHERE shard_id = ?""", (worker, now, now, row[0]))
+        self.conn.execute("COMMIT")
+        return (row[0], json.loads(row[1])) if row else None
+
+
+    def heartbeat(self, shard_id, worker):
+        """Marks a shard as still being worked on"""
+        self.conn.execute("UPDATE shards SET heartbeat = ? WHERE shard_id = ? AND worker = ?",
+                          (time.time(), shard_id, worker))
+
+
+    def finish(self, shard_id, worker, error=None):
+        """Marks a shard done, or pending again with the error if it failed so another worker retries
+        it, until it has failed max_attempts times"""
+        self.conn.execute("""UPDATE shards SET finished = ?, error = ?,
+            status = CASE WHEN ? IS NULL THEN 'done' WHEN attempts >= ? THEN 'failed' ELSE 'pending' END
+            WHERE shard_id = ? AND worker = ?""", (time.time(), error, error, ShardQueue.max_attempts, shard_id, worker))
+
+
+    def status(self):
+        """Returns the number of shards by status"""
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+
+
+    def shard_ids(self, status=None):
+        """Returns the IDs of all shards, or of the shards with the given status"""
+        if status is None:
+            return [row[0] for row in self.conn.execute("SELECT shard_id FROM shards ORDER BY shard_id")]
+        return [row[0] for row in self.conn.execute("SELECT shard_id FROM shards WHERE status = ? ORDER BY shard_id", (status,))]
+
+
+    def close(self):
+        """Closes the database"""
+        self.conn.close()
 
 
 class App():
@@ -556,16 +2271,45 @@ class App():
     root_dir = get_root_path(app_dir, max_depth=3, look_for=[".git", "requirements.txt"])
     data_dir = os.path.join(app_dir, "data")
 
-    def __init__(self, month, name):
-        """Initialises a project by creating the output folder if needed."""
+    def __init__(self, month, name, check_updates=True):
+        """Initialises a project by creating the output folder if needed. Checks for app updates
+        unless check_updates is False, e.g. for batch jobs and short reruns."""
 
-        self.git = GitController.check_for_app_updates(App.root_dir, allow_force_update=True)
+        self.git = None
+        if check_updates:
+            from sidt.utils.git import GitController
+            self.git = GitController.check_for_app_updates(App.root_dir, allow_force_update=True)
 
+        self.month = month
+        self.name = name
+        self._results = None
         self.project_name = f"{month}/{name}"
         self.project_dir = os.path.join(App.app_dir, "output", month, name)
         os.makedirs(self.project_dir, exist_ok=True)
 
 
+    @property
+    def results(self):
+        """Results are streamed to scraped.csv while scraping, and only read back from
+        the file when first accessed, e.g. for geocoding"""
+        if self._results is None:
+            filepath = os.path.join(self.project_dir, "scraped.csv")
+            self._results = Utils.load_data(filepath)[1] if os.path.exists(filepath) else []
+        return self._results
+
+
+    @results.setter
+    def results(self, results):
+        self._results = results
+
+
+    def profile(self, stage, mode="sampling", **kwargs):
+        """Returns a Profiler writing to profile-<stage>.* in the project folder, for profiling code
+        outside the App stages, e.g. geocoding with: with app.profile("geocoding"): ..."""
+        return Profiler(os.path.join(self.project_dir, f"profile-{stage}"), mode=mode, **kwargs)
+
+
+    @Profiler.stage("load")
     def load_from_file(self, filepath):
         """Load data from previously scraped ungeocoded / unaggregated file"""
 
@@ -574,35 +2318,357 @@ class App():
             )
     
 
-    def run_scraper(self, category_ids, tile_sets, visualiser):
-        """Loops over the category_ids given by user. Initialises a new MapsScraper
-        for each category_id. Appends the results to the self.results df. Intermittently
-        saves the data with each category_id."""
-        
-        self.results = []
+    @Profiler.stage("scraper")
+    def run_scraper(self, category_ids, tile_sets, visualiser, workers=1, rate_limit=None, pool_size=None, cache=True,
+                    resume=True, dedupe_across_categories=False, output_formats=("csv",), density_threshold=0,
+                    density_seed=True, incremental_from=None, event_log=True, metrics_format=None, tiles=None):
+        """Initialises a MapsScraper for each category_id given by user and runs them all over the
+        tile sets in a single worker pool. Results are streamed to scraped.csv as tiles complete.
+        The settings are described in the readme, tiles restricts the search to the given tile IDs."""
+
+        if not category_ids:
+            return
+
+        self.results = None
+        self.duplicates = []
+        seen_ids = set() if dedupe_across_categories else None
+        self.rate_limiter = RateLimiter(**(rate_limit or {}))
+        self.session = HTTPSession(pool_size=pool_size or max(workers, 10))
+        metrics = Metrics(filepath=os.path.join(self.project_dir, f"metrics.{metrics_format}") if metrics_format else None)
+        self.writer = ResultWriter(
+            filepath = os.path.join(self.project_dir, "scraped.csv"),
+            formats = output_formats,
+            )
+        self.cache = None
+        if cache:
+            self.cache = ResponseCache(
+                filepath = os.path.join(App.app_dir, "output", self.month, "response_cache.sqlite"),
+                **(cache if isinstance(cache, dict) else {})
+                )
+        prog_bar = tqdm(dynamic_ncols=True)
+        initial_tiles = MapsScraper.load_tiles(tile_sets)
+        if tiles is not None:
+            # Shards may list subtiles of the expanded tiles, which keep their tile set and parent
+            by_id = {tile.tile_id: tile for tile in initial_tiles}
+            selected = []
+            for tile_id in tiles:
+                ancestor = next((by_id[tile_id[:i]] for i in range(len(tile_id), -1, -1) if tile_id[:i] in by_id), None)
+                if ancestor:
+                    selected.append(Tile(int(tile_id, 4) if tile_id else 0, len(tile_id), ancestor.tile_set_i, ancestor.parent_i))
+            initial_tiles = selected
+        previous_dir = os.path.join(App.app_dir, "output", incremental_from) if incremental_from else None
+        density = DensityMap(
+            threshold = density_threshold,
+            filepath = os.path.join(App.app_dir, "output", "density.sqlite"),
+            seed = density_seed,
+            )
+
+        scrapers = []
         for category_id_i, category_id in enumerate(category_ids):
             # Initialise scraper
             scraper = MapsScraper(
                 params = {
                     # API config
                     "app_id": "5BA026015AD3D08EF01FBD643CF7E9061C63A23B",
+                    "url": None,
                     "category_id_i": category_id_i,
                     "category_id": category_id,
                     "chain_id": "",
                     "search_term": "",
                     "tile_sets": tile_sets,
-                    "visualiser_settings": visualiser
+                    "visualiser_settings": visualiser,
+                    "workers": workers,
+                    "rate_limiter": self.rate_limiter,
+                    "session": self.session,
+                    "cache": self.cache,
+                    "checkpoint": os.path.join(self.project_dir, "checkpoints", f"{category_id}.jsonl"),
+                    "previous_checkpoint": App.find_checkpoint(previous_dir, category_id),
+                    "resume": resume,
+                    "seen_ids": seen_ids,
+                    "writer": self.writer,
+                    "density": density,
+                    "metrics": metrics,
+                    "initial_tiles": initial_tiles,
+                    "prog_bar": prog_bar,
                 }
             )
+            scrapers.append(scraper)
+
+        # Run all categories in one pool, results are saved as they arrive
+        Scheduler(scrapers, workers=workers, visualiser_settings=visualiser,
+                  event_log=os.path.join(self.project_dir, "events.jsonl") if event_log else None).run()
+
+        # Record where tiles overlap
+        for scraper in scrapers:
+            for (tile_set, tile_id), count in scraper.duplicates.items():
+                self.duplicates.append({"category_id": scraper.category_id, "tile_set": tile_set, "tile_id": tile_id, "duplicates": count})
 
-            # Run scraper and save results
-            self.results.extend(scraper.run())
+        if self.duplicates:
             Utils.save_data_to_csv(
-                filepath = os.path.join(self.project_dir, "scraped.csv"),
-                data = self.results
+                filepath = os.path.join(self.project_dir, "duplicates.csv"),
+                data = self.duplicates
                 )
 
+        if previous_dir and tiles is None:
+            self.writer.flush()
+            self.save_incremental_diff(previous_dir, [scraper.category_id for scraper in scrapers])
+
+        with metrics.time("save"):
+            self.writer.close()
+        metrics.export(force=True)
+        self.metrics = metrics.summary()
+        self.session_stats = self.session.stats()
+        self.session.close()
+        if self.cache:
+            self.cache_stats = self.cache.stats()
+            self.cache.close()
+
     
+    def run_sharded(self, category_ids, tile_sets, shards=8, processes=4, stale_after=300, **kwargs):
+        """Runs the scraper sharded by quadkey prefix, see the readme. The tile sets are partitioned in a
+        ShardQueue, processes workers scrape the shards with the run_scraper settings in kwargs, then
+        the shards are merged. The response cache is disabled so shard processes don't contend for it."""
+
+        if not category_ids:
+            return
+
+        shard_queue = ShardQueue(os.path.join(self.project_dir, "shards.sqlite"))
+        settings = {"category_ids": list(category_ids), "tile_sets": list(tile_sets), **kwargs, "cache": False}
+        shard_queue.plan(MapsScraper.load_tiles(tile_sets), shards, settings)
+        processes = min(processes, len(shard_queue.shard_ids()) - len(shard_queue.shard_ids("done")))
+        print(f"Running {len(shard_queue.shard_ids())} shards in {processes} processes, {shard_queue.status()}")
+        shard_queue.close()
+
+        workers = [multiprocessing.Process(target=App.shard_worker, args=(self.month, self.name, stale_after))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.merge_shards()
+
+
+    @staticmethod
+    def shard_worker(month, name, stale_after=300):
+        """Claims and runs the shards of a planned sharded run until none are left to claim, each as its own
+        project in the shards folder so interrupted shards resume from their checkpoints. Returns the
+        number of shards run."""
+
+        app = App(month, name, check_updates=False)
+        filepath = os.path.join(app.project_dir, "shards.sqlite")
+        shard_queue = ShardQueue(filepath)
+        settings = shard_queue.settings()
+        if settings is None:
+            raise ValueError(f"Project {app.project_name} has not been sharded, start it with run_sharded")
+
+        worker = f"{socket.gethostname()}-{os.getpid()}"
+        n_shards = 0
+        while True:
+            claimed = shard_queue.claim(worker, stale_after)
+            if claimed is None:
+                break
+            shard_id, tile_ids = claimed
+
+            # SQLite connections can't be shared between threads, the heartbeat opens its own
+            stop = threading.Event()
+            def heartbeat():
+                heartbeat_queue = ShardQueue(filepath)
+                while not stop.wait(stale_after / 5):
+                    heartbeat_queue.heartbeat(shard_id, worker)
+                heartbeat_queue.close()
+            thread = threading.Thread(target=heartbeat, daemon=True)
+            thread.start()
+
+            error = None
+            try:
+                shard_app = App(month, f"{name}/shards/{shard_id:03d}", check_updates=False)
+                shard_app.run_scraper(tiles=tile_ids, visualiser={"display": False}, **settings)
+            except Exception as e:
+                error = repr(e)
+                print(f"Shard {shard_id} failed on {worker}: {error}")
+            finally:
+                stop.set()
+                thread.join()
+            shard_queue.finish(shard_id, worker, error)
+            n_shards += 1
+
+        shard_queue.close()
+        return n_shards
+
+
+    def merge_shards(self):
+        """Combines the outputs of the completed shards of a sharded run into the project folder as if it had
+        run unsharded, deduplicating results globally and concatenating checkpoints per category.
+        Saves the incremental diff if the run set incremental_from."""
+
+        shard_queue = ShardQueue(os.path.join(self.project_dir, "shards.sqlite"))
+        settings = shard_queue.settings()
+        if settings is None:
+            raise ValueError(f"Project {self.project_name} has not been sharded, start it with run_sharded")
+        done = shard_queue.shard_ids(status="done")
+        n_shards = len(shard_queue.shard_ids())
+        if len(done) < n_shards:
+            print(f"Only {len(done)} of {n_shards} shards are done {shard_queue.status()}, merging the completed shards")
+        shard_queue.close()
+        shard_dirs = [os.path.join(self.project_dir, "shards", f"{shard_id:03d}") for shard_id in done]
+
+        # Results, deduplicated across shards
+        self.results = None
+        writer = ResultWriter(
+            filepath = os.path.join(self.project_dir, "scraped.csv"),
+            formats = settings.get("output_formats", ("csv",)),
+            )
+        across_categories = settings.get("dedupe_across_categories", False)
+        seen_ids = set()
+        duplicates = Counter()
+        for shard_dir in shard_dirs:
+            filepath = os.path.join(shard_dir, "scraped.csv")
+            if os.path.exists(filepath):
+                with open(filepath, "r", newline="", encoding="utf-8") as file:
+                    for result in csv.DictReader(file):
+                        key = result.get("id") if across_categories else (result.get("category_id"), result.get("id"))
+                        if key in seen_ids:
+                            duplicates[(result.get("category_id"), result.get("tile_set"), result.get("tile_id"))] += 1
+                            continue
+                        seen_ids.add(key)
+                        writer.write([result])
+
+            # Duplicates within the shard
+            filepath = os.path.join(shard_dir, "duplicates.csv")
+            if os.path.exists(filepath):
+                with open(filepath, "r", newline="", encoding="utf-8") as file:
+                    for row in csv.DictReader(file):
+                        duplicates[(row["category_id"], row["tile_set"], row["tile_id"])] += int(row["duplicates"])
+        writer.close()
+
+        self.duplicates = [{"category_id": category_id, "tile_set": tile_set, "tile_id": tile_id, "duplicates": count}
+                           for (category_id, tile_set, tile_id), count in duplicates.items()]
+        if self.duplicates:
+            Utils.save_data_to_csv(
+                filepath = os.path.join(self.project_dir, "duplicates.csv"),
+                data = self.duplicates
+                )
+
+        # Checkpoints, marked complete only if every shard completed the category
+        for category_id in settings["category_ids"]:
+            filepath = os.path.join(self.project_dir, "checkpoints", f"{category_id}.jsonl")
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            complete = len(done) == n_shards
+            header = False
+            with open(filepath, "w") as dst:
+                for shard_dir in shard_dirs:
+                    shard_checkpoint = App.find_checkpoint(shard_dir, category_id)
+                    if shard_checkpoint is None:
+                        complete = False
+                        continue
+                    shard_complete = False
+                    with open(shard_checkpoint, "r") as src:
+                        for line in src:
+                            try:
+                                record = json.loads(line)
+                            except json.JSONDecodeError:
+                                break
+                            if record["type"] == "complete":
+                                shard_complete = True
+                            elif record["type"] != "header" or not header:
+                                header = header or record["type"] == "header"
+                                dst.write(line if line.endswith("\n") else line + "\n")
+                    complete = complete and shard_complete
+                if complete:
+                    dst.write(json.dumps({"type": "complete"}) + "\n")
+
+        print(f"Merged {len(shard_dirs)} shards, {writer.count} locations saved and "
+              f"{sum(duplicates.values())} duplicate records dropped")
+
+        if settings.get("incremental_from"):
+            self.save_incremental_diff(os.path.join(App.app_dir, "output", settings["incremental_from"]), settings["category_ids"])
+
+
+    @staticmethod
+    def find_checkpoint(project_dir, category_id):
+        """Returns the path of a category's checkpoint in a project, or None if it has none"""
+        if project_dir is None:
+            return None
+        filepath = os.path.join(project_dir, "checkpoints", f"{category_id}.jsonl")
+        return filepath if os.path.exists(filepath) else None
+
+
+    def save_incremental_diff(self, previous_dir, category_ids):
+        """Compares this project with a previous one. Saves tile_changes.csv, listing each leaf tile
+        of the previous run as unchanged, changed (different result ids) or split (now over the cap),
+        and diff.csv, listing locations added, removed or moved since the previous run."""
+
+        # Compare the result ids under each previous leaf tile
+        tile_changes = []
+        for category_id in category_ids:
+            previous_checkpoint = App.find_checkpoint(previous_dir, category_id)
+            if previous_checkpoint is None:
+                continue
+            previous_leaves = Checkpoint.read_leaves(previous_checkpoint)
+            leaves = Checkpoint.read_leaves(App.find_checkpoint(self.project_dir, category_id))
+
+            # Group new leaves under the previous leaf they were seeded from
+            ids_under, split = {}, set()
+            for tile_id, ids in leaves.items():
+                for i in range(len(tile_id), 0, -1):
+                    if tile_id[:i] in previous_leaves:
+                        ids_under.setdefault(tile_id[:i], set()).update(ids)
+                        if i < len(tile_id):
+                            split.add(tile_id[:i])
+                        break
+
+            for tile_id, previous_ids in previous_leaves.items():
+                ids = ids_under.get(tile_id, set())
+                status = "split" if tile_id in split else "unchanged" if ids == set(previous_ids) else "changed"
+                tile_changes.append({
+                    "category_id": category_id,
+                    "tile_id": tile_id,
+                    "previous_count": len(previous_ids),
+                    "count": len(ids),
+                    "added": len(ids - set(previous_ids)),
+                    "removed": len(set(previous_ids) - ids),
+                    "status": status,
+                })
+        if tile_changes:
+            Utils.save_data_to_csv(
+                filepath = os.path.join(self.project_dir, "tile_changes.csv"),
+                data = tile_changes
+                )
+
+        # Compare locations by id, reading only the columns and categories compared chunk by chunk.
+        # scraped.csv is only written once a result is found
+        cols = ["category_id", "id", "name", "latitude", "longitude"]
+        def load_locations(filepath):
+            chunks = [chunk.loc[chunk["category_id"].isin(category_ids), cols]
+                      for chunk in Utils.iter_data(filepath)] if os.path.exists(filepath) else []
+            if not chunks:
+                return pd.DataFrame({col: pd.Series(dtype=float if col in ("latitude", "longitude") else str) for col in cols})
+            return pd.concat(chunks, ignore_index=True)
+        previous_df = load_locations(os.path.join(previous_dir, "scraped.csv"))
+        df = load_locations(os.path.join(self.project_dir, "scraped.csv"))
+        merged = previous_df[cols].merge(df[cols], on=["category_id", "id"], how="outer",
+                                         suffixes=("_previous", ""), indicator=True)
+        moved = (merged["_merge"] == "both") & (
+            ((merged["latitude"] - merged["latitude_previous"]).abs() > 1e-6) |
+            ((merged["longitude"] - merged["longitude_previous"]).abs() > 1e-6))
+        merged["change"] = None
+        merged.loc[merged["_merge"] == "right_only", "change"] = "added"
+        merged.loc[merged["_merge"] == "left_only", "change"] = "removed"
+        merged.loc[moved, "change"] = "moved"
+        diff = merged[merged["change"].notna()].drop(columns="_merge")
+        Utils.save_data_to_csv(
+            filepath = os.path.join(self.project_dir, "diff.csv"),
+            data = diff.to_dict(orient="records")
+            )
+
+        counts = diff["change"].value_counts()
+        n_changed = sum(change["status"] != "unchanged" for change in tile_changes)
+        print(f"{counts.get('added', 0)} locations added, {counts.get('removed', 0)} removed and "
+              f"{counts.get('moved', 0)} moved, {n_changed} of {len(tile_changes)} tiles changed")
+
+
+    @Profiler.stage("aggregate")
     def aggregate_results(self, gdf):
         """Finalise the results and then aggregate them by region"""
 
@@ -632,9 +2698,11 @@ class App():
         self.aggregated = pivot_df.to_dict(orient="records")
 
 
+    @Profiler.stage("save")
     def save_final_results(self, open_file=True):
         """Saves the final results to an xlsx file using xlwriter."""
 
+        from sidt.utils.io import XLWriter
         filename = os.path.join(self.project_dir, "final_results.xlsx")
         writer = XLWriter(filename)
         writer.add_sheet(pd.DataFrame(self.results), "Scraped Data", "Scraped Data", description="Scraped data with geocoded locations.")
@@ -0,0 +1,102 @@
+import argparse
+import time
+from contextlib import nullcontext
+
+start = time.perf_counter()
+
+
+def parse_args(args=None):
+    """Parses the command line arguments of a headless run"""
+    parser = argparse.ArgumentParser(
+        description="Headless Bing Maps scraper. Plotting and geocoding modules are only imported by the stages that use them.",
+    )
+    parser.add_argument("--month", required=True, help="Month of the project, e.g. 2024-11")
+    parser.add_argument("--name", required=True, help="Name of the project within the month")
+    parser.add_argument("--categories", nargs="+", default=[], help="Category IDs to scrape")
+    parser.add_argument("--tile-sets", nargs="+", default=[], help="Tile sets from config.json to scrape")
+    parser.add_argument("--stages", nargs="+", default=["scrape"], choices=["scrape", "shard-worker", "merge", "geocode", "save"],
+                        help="Stages to run. shard-worker joins a sharded run started elsewhere and merge combines its "
+                             "completed shards. geocode also aggregates the results by region and save needs both")
+    parser.add_argument("--load", help="Load previously scraped data from a file relative to the app folder instead of scraping")
+
+    # Scraper settings
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=10, help="Target requests per second")
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the response cache")
+    parser.add_argument("--no-resume", action="store_true", help="Start over instead of resuming from checkpoints")
+    parser.add_argument("--dedupe-across-categories", action="store_true")
+    parser.add_argument("--incremental-from", help="Previous project to rescrape incrementally, e.g. 2024-10/uk")
+    parser.add_argument("--display", action="store_true", help="Show the visualiser while scraping")
+    parser.add_argument("--metrics-format", choices=["prom", "jsonl"], help="Export metrics to the project folder during the run")
+    parser.add_argument("--shards", type=int, help="Shard the scrape by quadkey prefix into this many shards")
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes for sharded scrapes")
+    parser.add_argument("--stale-after", type=int, default=300, help="Seconds before a shard without heartbeat is claimed again")
+    parser.add_argument("--profile", choices=["sampling", "cprofile"], help="Profile each stage into the project folder")
+
+    # Geocoding settings
+    parser.add_argument("--geocode-package", default="uk_local_authorities",
+                        help="Valid packages: us_states, us_counties, us_primary_roads, european_countries, countries, uk_local_authorities")
+    parser.add_argument("--geocode-distance", type=float, default=100)
+
+    parser.add_argument("--check-updates", action="store_true", help="Check for app updates on start")
+    parser.add_argument("--open", action="store_true", help="Open the final results when saved")
+
+    args = parser.parse_args(args)
+    if "scrape" in args.stages and not args.load and not args.categories:
+        parser.error("--categories is required to scrape, or --load a previous scrape")
+    if "save" in args.stages and "geocode" not in args.stages:
+        parser.error("--stages save needs geocode, which aggregates the results to save")
+    return args
+
+
+def main(args=None):
+    """Runs the requested stages of a project without any interactive steps"""
+    args = parse_args(args)
+    from app.main import App
+    app = App(month=args.month, name=args.name, check_updates=args.check_updates)
+    print(f"Started in {time.perf_counter() - start:.2f}s")
+
+    if args.load:
+        app.load_from_file(args.load, profile=args.profile)
+
+    settings = {
+        "workers": args.workers,
+        "rate_limit": {"rate": args.rate, "burst": args.burst},
+        "cache": not args.no_cache,
+        "resume": not args.no_resume,
+        "dedupe_across_categories": args.dedupe_across_categories,
+        "incremental_from": args.incremental_from,
+        "metrics_format": args.metrics_format,
+        "profile": args.profile,
+    }
+    scrape = "scrape" in args.stages and not args.load
+    if scrape and args.shards:
+        app.run_sharded(args.categories, args.tile_sets, shards=args.shards, processes=args.processes,
+                        stale_after=args.stale_after, **settings)
+    elif scrape:
+        app.run_scraper(
+            category_ids = args.categories,
+            tile_sets = args.tile_sets,
+            visualiser = {"display": args.display, "overlay_map": True, "overlay_ids": False},
+            **settings,
+        )
+
+    if "shard-worker" in args.stages:
+        App.shard_worker(args.month, args.name, stale_after=args.stale_after)
+    if "merge" in args.stages:
+        app.merge_shards()
+
+    if "geocode" in args.stages:
+        from sidt.utils.geocoders import Geocoder
+        with app.profile("geocoding", args.profile) if args.profile else nullcontext():
+            app.geo_df, gdf = Geocoder.find_regions_within_distance(app.results, distance=args.geocode_distance,
+                                                                    package_gdf=args.geocode_package, return_gdf=True)
+        app.aggregate_results(gdf, profile=args.profile)
+
+    if "save" in args.stages:
+        app.save_final_results(open_file=args.open, profile=args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 from app.main import App, Utils
-from sidt.utils.geocoders import Geocoder
 
 if __name__ == "__main__":
 
@@ -20,7 +19,9 @@ if __name__ == "__main__":
             "display": True,
             "overlay_map": True,
             "overlay_ids": False,
-        }
+        },
+        workers = 4,
+        rate_limit = {"rate": 10, "burst": 20},
     )
     Utils.display_scatter(app.results)
 
@@ -28,6 +29,7 @@ if __name__ == "__main__":
     Geocode the scrape results / previously scraped data
     Valid packages: us_states, us_counties, us_primary_roads, european_countries, countries, uk_local_authorities
     """
+    from sidt.utils.geocoders import Geocoder
     app.geo_df, gdf = Geocoder.find_regions_within_distance(app.results, distance=100, package_gdf="uk_local_authorities", return_gdf=True)
 
     """Save the results to a file"""